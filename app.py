@@ -1,31 +1,110 @@
-from flask import Flask, jsonify
-from config import Config
-from routes.inference_routes import inference_bp
-from routes.training_routes import train_bp
-from services import system_service # 导入硬件监控服务
-from routes.labeling_routes import label_bp
-from routes.dashboard_routes import dashboard_bp
+from services import startup_service # 启动耗时统计，需最先导入
+
+with startup_service.timed('flask'):
+    import time
+    from flask import Flask, jsonify, request, g, Response
+with startup_service.timed('config'):
+    from config import Config
+# 蓝图和 service 不在模块级导入 torch / cv2 / pandas，重依赖延迟到首次使用
+with startup_service.timed('routes.inference_routes'):
+    from routes.inference_routes import inference_bp
+with startup_service.timed('routes.training_routes'):
+    from routes.training_routes import train_bp
+with startup_service.timed('services.system_service'):
+    from services import system_service # 导入硬件监控服务
+with startup_service.timed('services.metrics_service'):
+    from services import metrics_service
+with startup_service.timed('routes.labeling_routes'):
+    from routes.labeling_routes import label_bp
+with startup_service.timed('routes.dashboard_routes'):
+    from routes.dashboard_routes import dashboard_bp
+with startup_service.timed('routes.evaluation_routes'):
+    from routes.evaluation_routes import eval_bp
+with startup_service.timed('routes.upload_routes'):
+    from routes.upload_routes import upload_bp
+with startup_service.timed('routes.artifact_routes'):
+    from routes.artifact_routes import artifact_bp
 
 def create_app():
     app = Flask(__name__)
     
     # 1. 初始化
-    Config.init_dirs()
+    with startup_service.timed('init_dirs', 'init'):
+        Config.init_dirs()
     
     # 2. 注册蓝图
-    app.register_blueprint(inference_bp)
-    app.register_blueprint(train_bp)
-    app.register_blueprint(label_bp)
-    app.register_blueprint(dashboard_bp)    
+    with startup_service.timed('register_blueprints', 'init'):
+        app.register_blueprint(inference_bp)
+        app.register_blueprint(train_bp)
+        app.register_blueprint(label_bp)
+        app.register_blueprint(dashboard_bp)
+        app.register_blueprint(eval_bp)
+        app.register_blueprint(upload_bp)
+        app.register_blueprint(artifact_bp)
     
     # 3. 注册系统监控路由 (直接写在这里最方便)
     @app.route('/system_status')
     def system_status():
         return jsonify(system_service.get_system_status())
+
+    # 4. 启动耗时报告 (按模块/步骤拆分，包含延迟导入的重依赖)
+    @app.route('/api/startup_report')
+    def startup_report():
+        return jsonify(startup_service.get_startup_report())
+
+    # 5. 请求级指标 + 慢请求采样分析
+    @app.before_request
+    def _metrics_begin():
+        g.metrics_start = time.perf_counter()
+        g.metrics_endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        g.metrics_sampler = metrics_service.start_request_profiler()
+        metrics_service.gauge_add('yolo_http_request_in_flight', 1, endpoint=g.metrics_endpoint)
+
+    @app.after_request
+    def _metrics_status(response):
+        metrics_service.inc('yolo_http_responses_total', endpoint=g.metrics_endpoint, code=response.status_code)
+        return response
+
+    @app.teardown_request
+    def _metrics_end(exc):
+        if 'metrics_start' not in g: return
+        elapsed = time.perf_counter() - g.metrics_start
+        metrics_service.observe('yolo_http_request_duration_seconds', elapsed, endpoint=g.metrics_endpoint)
+        metrics_service.inc('yolo_http_request_total', endpoint=g.metrics_endpoint,
+                            status='error' if exc else 'ok')
+        metrics_service.gauge_add('yolo_http_request_in_flight', -1, endpoint=g.metrics_endpoint)
+        metrics_service.finish_request_profiler(g.metrics_sampler, f"{request.method}_{g.metrics_endpoint}", elapsed)
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(metrics_service.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+    # 开关采样分析器: POST {"enabled": true, "slow_ms": 1500}
+    @app.route('/api/profiler', methods=['GET', 'POST'])
+    def profiler_toggle():
+        if request.method == 'POST':
+            data = request.json or {}
+            return jsonify(metrics_service.set_profiler(data.get('enabled'), data.get('slow_ms')))
+        return jsonify(metrics_service.set_profiler())
+
+    # 6. 可选: 后台预热默认模型
+    if Config.WARMUP_MODEL:
+        from services import inference_service
+        inference_service.warmup_model(Config.WARMUP_MODEL)
+    
+    # 7. CPU 推理执行管理器 (固定数量的模型副本进程，可自动调优)
+    if Config.INFER_REPLICAS or Config.INFER_AUTOTUNE:
+        from services import executor_service
+        executor_service.start(Config.WARMUP_MODEL or None)
+    
+    # 8. 磁盘保留策略 (后台定时清理)
+    if Config.RETENTION_ENABLED:
+        from services import retention_service
+        retention_service.start_scheduler()
     
     return app
 
 if __name__ == '__main__':
     app = create_app()
     print("🚀 YOLO 平台已启动: http://localhost:7860")
-    app.run(host='0.0.0.0', port=7860, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=7860, debug=True)
@@ -8,14 +8,95 @@ class Config:
     RESULT_FOLDER = os.path.join(BASE_DIR, 'static/results')
     DATASET_FOLDER = os.path.join(BASE_DIR, 'datasets')
     RUNS_FOLDER = os.path.join(BASE_DIR, 'runs')
+    CACHE_FOLDER = os.path.join(BASE_DIR, 'cache')
+    SWEEP_FOLDER = os.path.join(BASE_DIR, 'sweeps')
+    CHUNK_FOLDER = os.path.join(BASE_DIR, 'uploads_partial')
     
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'mp4', 'avi', 'mov', 'zip'}
     
+    # 启动后在后台预热的默认模型 (留空则不预热)，例如 WARMUP_MODEL=yolo11n.pt
+    WARMUP_MODEL = os.environ.get('WARMUP_MODEL', '')
+    
+    # 推理结果缓存上限 (MB)，超出后按 LRU 淘汰
+    RESULT_CACHE_MAX_MB = int(os.environ.get('RESULT_CACHE_MAX_MB', 2048))
+    
+    # 同时运行的实时流推理数量上限
+    MAX_STREAMS = int(os.environ.get('MAX_STREAMS', 4))
+    
+    # 训练前校验数据集并建立解码缓存 (cache/images)，训练时使用 cache=disk
+    DATASET_CACHE = os.environ.get('DATASET_CACHE', 'True') == 'True'
+    # 标注坐标略超出 [0, 1] (浮点误差 / 标注工具取整) 且不超过该容差时截断到边界，而不是丢弃整行
+    LABEL_CLAMP_TOLERANCE = float(os.environ.get('LABEL_CLAMP_TOLERANCE', 0.02))
+    # 解码缓存 (cache/images) 上限 (MB)，超出后按最近使用时间淘汰 (本次训练用到的不删)
+    IMAGE_CACHE_MAX_MB = int(os.environ.get('IMAGE_CACHE_MAX_MB', 20480))
+    
+    # 近重复图片检测: dHash 汉明距离 <= DEDUP_RADIUS 视为重复
+    # DEDUP_MODE: flag (上传时提示) / skip (直接丢弃重复图片) / off
+    DEDUP_RADIUS = int(os.environ.get('DEDUP_RADIUS', 6))
+    DEDUP_MODE = os.environ.get('DEDUP_MODE', 'flag')
+    
+    # 产物浏览 (runs/ 与 static/results): 目录分页大小、缩略图最长边 (像素)，缩略图缓存在 cache/thumbs
+    # 超过 HLS_MIN_MB 的视频会在后台切成 HLS_SEGMENT_SECONDS 秒的 HLS 切片 (cache/hls)，拖动进度条时只下载附近的切片
+    ARTIFACT_PAGE_SIZE = int(os.environ.get('ARTIFACT_PAGE_SIZE', 60))
+    THUMB_SIZE = int(os.environ.get('THUMB_SIZE', 256))
+    HLS_MIN_MB = float(os.environ.get('HLS_MIN_MB', 50))
+    HLS_SEGMENT_SECONDS = int(os.environ.get('HLS_SEGMENT_SECONDS', 6))
+    
+    # 紧凑二进制格式 (.ypack): PACKED_METRICS=True 时仪表盘 / 训练曲线 / Sweep / 保留策略读取 results.csv 旁边自动生成的
+    # results.ypack (np.memmap 映射，不再用 pandas 逐个解析)，csv 变化后自动重建；标注包用 python -m services.packed_service 转换
+    PACKED_METRICS = os.environ.get('PACKED_METRICS', '') == 'True'
+    
+    # 标注自动保存: 同一张图片最后一次修改 LABEL_SAVE_DEBOUNCE 秒后才写入 txt，期间的多次保存合并为一次
+    LABEL_SAVE_DEBOUNCE = float(os.environ.get('LABEL_SAVE_DEBOUNCE', 1.0))
+    
+    # 分块上传: 超过 CHUNK_EXPIRE_HOURS 小时未更新的未完成上传会被清理
+    CHUNK_EXPIRE_HOURS = float(os.environ.get('CHUNK_EXPIRE_HOURS', 24))
+    
+    # CPU 推理执行管理器: INFER_REPLICAS 个模型副本进程，每个 INFER_THREADS 个 torch 线程 (0 = 按核心数平分) 并绑定到独立的核心
+    # INFER_AUTOTUNE=True 时启动后先测量不同 (副本数, 线程数) 组合的吞吐再选择；两者都未设置时推理在请求线程内执行
+    INFER_REPLICAS = int(os.environ.get('INFER_REPLICAS', 0))
+    INFER_THREADS = int(os.environ.get('INFER_THREADS', 0))
+    INFER_AUTOTUNE = os.environ.get('INFER_AUTOTUNE', '') == 'True'
+    INFER_AUTOTUNE_ITERS = int(os.environ.get('INFER_AUTOTUNE_ITERS', 8))
+    INFER_MAX_REPLICAS = int(os.environ.get('INFER_MAX_REPLICAS', 8))
+    
+    # CPU 数据并行训练 (torchrun + gloo): 每个节点 DDP_NPROC 个进程，DDP_NNODES 个节点，>1 时启用
+    # 本机为 node 0；rendezvous 默认 static (MASTER_ADDR:PORT)，也可选 c10d；任意 rank 退出后整组最多重启 DDP_MAX_RESTARTS 次
+    DDP_NPROC = int(os.environ.get('DDP_NPROC', 1))
+    DDP_NNODES = int(os.environ.get('DDP_NNODES', 1))
+    DDP_MASTER_ADDR = os.environ.get('DDP_MASTER_ADDR', '127.0.0.1')
+    DDP_MASTER_PORT = int(os.environ.get('DDP_MASTER_PORT', 29500))
+    DDP_RDZV_BACKEND = os.environ.get('DDP_RDZV_BACKEND', 'static')
+    DDP_MAX_RESTARTS = int(os.environ.get('DDP_MAX_RESTARTS', 3))
+    DDP_TIMEOUT = int(os.environ.get('DDP_TIMEOUT', 3600))
+    
+    # 磁盘保留策略: 后台每 RETENTION_INTERVAL_MIN 分钟按策略清理 (默认关闭，可在设置页先预览)
+    # max_age_days / max_mb 为 0 表示不限制；runs 中 mAP50-95 前 keep_top_k 的任务永远保留，
+    # 其余任务过期后只保留 weights/best.pt (和很小的 results.csv)
+    RETENTION_ENABLED = os.environ.get('RETENTION_ENABLED', '') == 'True'
+    RETENTION_INTERVAL_MIN = float(os.environ.get('RETENTION_INTERVAL_MIN', 60))
+    RETENTION_POLICY = {
+        "uploads": {"max_age_days": float(os.environ.get('RETENTION_UPLOADS_DAYS', 7)),
+                    "max_mb": float(os.environ.get('RETENTION_UPLOADS_MAX_MB', 0))},
+        "results": {"max_age_days": float(os.environ.get('RETENTION_RESULTS_DAYS', 7)),
+                    "max_mb": float(os.environ.get('RETENTION_RESULTS_MAX_MB', 0))},
+        "runs": {"max_age_days": float(os.environ.get('RETENTION_RUNS_DAYS', 30)),
+                 "max_mb": float(os.environ.get('RETENTION_RUNS_MAX_MB', 0)),
+                 "keep_top_k": int(os.environ.get('RETENTION_KEEP_TOP_RUNS', 5))},
+        "datasets": {"max_age_days": float(os.environ.get('RETENTION_DATASETS_DAYS', 30)),
+                     "max_mb": float(os.environ.get('RETENTION_DATASETS_MAX_MB', 0))}
+    }
+    
+    # 采样分析器: 开启后超过阈值的慢请求会把栈采样 (folded stacks) 保存到 cache/profiles
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', '') == 'True'
+    PROFILER_SLOW_MS = float(os.environ.get('PROFILER_SLOW_MS', 2000))
+    
     # 确保目录存在
     @staticmethod
     def init_dirs():
         for folder in [Config.UPLOAD_FOLDER, Config.RESULT_FOLDER, 
-                       Config.DATASET_FOLDER, Config.RUNS_FOLDER]:
+                       Config.DATASET_FOLDER, Config.RUNS_FOLDER, Config.CACHE_FOLDER,
+                       Config.SWEEP_FOLDER, Config.CHUNK_FOLDER]:
             os.makedirs(folder, exist_ok=True)
 
     @staticmethod
@@ -0,0 +1,44 @@
+import os
+from flask import Blueprint, request, jsonify
+from services import artifact_service
+
+artifact_bp = Blueprint('artifact', __name__)
+
+# === 训练 / 推理产物 (runs/<name>、static/results) ===
+@artifact_bp.route('/api/artifacts/<root>')
+@artifact_bp.route('/api/artifacts/<root>/<path:path>')
+def list_artifacts(root, path=''):
+    listing = artifact_service.list_dir(root, path,
+                                        page=request.args.get('page', 1, type=int),
+                                        page_size=request.args.get('page_size', type=int),
+                                        sort=request.args.get('sort', 'name'))
+    if listing is None: return jsonify({"status": "error", "message": "目录不存在"}), 404
+    return jsonify(listing)
+
+@artifact_bp.route('/artifacts/<root>/<path:path>')
+def serve_artifact(root, path):
+    file_path = artifact_service.resolve(root, path)
+    if file_path is None or os.path.isdir(file_path): return "", 404
+    return artifact_service.send(file_path)
+
+@artifact_bp.route('/artifacts/thumb/<root>/<path:path>')
+def serve_thumbnail(root, path):
+    try:
+        thumb = artifact_service.thumbnail(root, path, request.args.get('size', type=int))
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    if thumb is None: return "", 404
+    return artifact_service.send(thumb, mimetype='image/jpeg')
+
+@artifact_bp.route('/api/artifacts/hls/<root>/<path:path>')
+def hls_status(root, path):
+    # 大视频: 第一次请求时在后台切片，前端轮询到 ready 后切换到 playlist
+    status = artifact_service.hls(root, path)
+    if status is None: return jsonify({"status": "error", "message": "视频不存在"}), 404
+    return jsonify(status)
+
+@artifact_bp.route('/artifacts/hls/<key>/<name>')
+def serve_hls(key, name):
+    file_path = artifact_service.hls_file(key, name)
+    if file_path is None: return "", 404
+    return artifact_service.send(file_path)
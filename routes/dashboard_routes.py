@@ -1,5 +1,5 @@
 from flask import Blueprint, render_template, jsonify, request
-from services import dashboard_service, system_service
+from services import dashboard_service, system_service, retention_service
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
@@ -32,4 +32,14 @@ def delete_run():
     run_name = request.json.get('name')
     if dashboard_service.delete_run(run_name):
         return jsonify({"status": "success"})
-    return jsonify({"status": "error"}), 400
\ No newline at end of file
+    return jsonify({"status": "error"}), 400
+# === 磁盘保留策略: GET 预览 (dry-run)，POST 按同样的策略执行 ===
+@dashboard_bp.route('/api/retention', methods=['GET', 'POST'])
+def retention():
+    data = request.get_json(silent=True) or {}
+    dry_run = request.method == 'GET' or data.get('dry_run') is True
+    try:
+        report = retention_service.run_retention(dry_run=dry_run, policy=data.get('policy'))
+        return jsonify({"status": "success", **report})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
@@ -0,0 +1,34 @@
+from flask import Blueprint, render_template, jsonify, request
+from services import evaluation_service, inference_service
+
+eval_bp = Blueprint('evaluation', __name__)
+
+@eval_bp.route('/evaluation')
+def index():
+    return render_template('evaluation.html', active_page='evaluation',
+                           models=inference_service.get_available_models(),
+                           datasets=evaluation_service.get_datasets())
+
+@eval_bp.route('/api/eval/start', methods=['POST'])
+def start_eval():
+    data = request.json or request.form
+    try:
+        job = evaluation_service.start_evaluation(
+            data.get('model_path'), data.get('dataset'),
+            imgsz=data.get('imgsz', 640), batch=data.get('batch', 16),
+            force=str(data.get('force')) == 'True'
+        )
+        # 指纹计算和缓存查找在后台进行，是否命中缓存通过 /api/eval/<id> 查询
+        return jsonify({"status": "success", "id": job['id']})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+@eval_bp.route('/api/eval/<job_id>')
+def eval_status(job_id):
+    job = evaluation_service.get_job(job_id)
+    if not job: return jsonify({"status": "error"}), 404
+    return jsonify(job)
+
+@eval_bp.route('/api/eval/compare')
+def compare():
+    return jsonify(evaluation_service.get_comparison())
@@ -1,8 +1,5 @@
-from flask import Blueprint, request, render_template
-from werkzeug.utils import secure_filename
-import os
-from config import Config
-from services import inference_service
+from flask import Blueprint, request, render_template, jsonify, Response
+from services import inference_service, stream_service, upload_service, executor_service
 
 inference_bp = Blueprint('inference', __name__)
 
@@ -14,22 +11,26 @@ def index():
 
 @inference_bp.route('/upload', methods=['POST'])
 def upload_file():
-    if 'file' not in request.files: return "No file", 400
-    file = request.files['file']
-    if file.filename == '': return "No file", 400
+    # 普通表单上传 (先存为唯一的临时文件)，或者已经通过分块上传完成的 upload_id (长视频)
+    try:
+        input_path = upload_service.resolve_upload(request.files.get('file'), request.form.get('upload_id'), keep_temp=True)
+    except Exception as e:
+        return str(e), 400
+    if not input_path: return "No file", 400
+    filename = upload_service.upload_name(input_path)
 
     # 获取前端传来的参数
     selected_model = request.form.get('model_path', 'yolo11l.pt') # 默认值
     conf_thres = float(request.form.get('conf', 0.25))
+    imgsz = int(request.form.get('imgsz', 640))
 
-    filename = secure_filename(file.filename)
-    input_path = os.path.join(Config.UPLOAD_FOLDER, filename)
-    file.save(input_path)
-    
-    # 调用 Service
-    result_url, detections, is_video = inference_service.process_media(
-        input_path, filename, selected_model, conf_thres
-    )
+    # 调用 Service (对临时文件计算 hash 和推理，完成后才出现在 uploads/<文件名>)
+    try:
+        result_url, detections, is_video = inference_service.process_media(
+            input_path, filename, selected_model, conf_thres, imgsz
+        )
+    finally:
+        upload_service.publish(input_path)
 
     # 重新获取模型列表(保持下拉框状态)
     models = inference_service.get_available_models()
@@ -41,4 +42,47 @@ def upload_file():
                            is_video=is_video,
                            active_page='inference',
                            models=models,
-                           current_model=selected_model) # 记住刚才选的模型
\ No newline at end of file
+                           current_model=selected_model, # 记住刚才选的模型
+                           current_imgsz=imgsz)
+
+# === 实时流推理 (摄像头 / RTSP / MJPEG / 本地视频按实时速度回放) ===
+@inference_bp.route('/api/stream/start', methods=['POST'])
+def start_stream():
+    data = request.json or request.form
+    try:
+        stream = stream_service.start_stream(
+            data.get('source', ''),
+            data.get('model_path', 'yolo11n.pt'),
+            float(data.get('conf', 0.25)),
+            int(data.get('imgsz', 640))
+        )
+        return jsonify({"status": "success", "id": stream.id, "feed": f"/stream/{stream.id}.mjpg"})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+@inference_bp.route('/stream/<stream_id>.mjpg')
+def stream_feed(stream_id):
+    stream = stream_service.get_stream(stream_id)
+    if not stream: return "", 404
+    return Response(stream.mjpeg_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@inference_bp.route('/api/stream/<stream_id>/stats')
+def stream_stats(stream_id):
+    stream = stream_service.get_stream(stream_id)
+    if not stream: return jsonify({"status": "error"}), 404
+    return jsonify(stream.info())
+
+@inference_bp.route('/api/stream/<stream_id>/stop', methods=['POST'])
+def stop_stream(stream_id):
+    if stream_service.stop_stream(stream_id):
+        return jsonify({"status": "success"})
+    return jsonify({"status": "error"}), 404
+
+@inference_bp.route('/api/streams')
+def list_streams():
+    return jsonify(stream_service.get_streams())
+
+# === CPU 推理执行管理器状态 (副本数 / 线程数 / 绑定核心 / 调优结果) ===
+@inference_bp.route('/api/executor')
+def executor_status():
+    return jsonify(executor_service.get_status())
@@ -1,7 +1,7 @@
 from flask import Blueprint, render_template, request, jsonify, send_from_directory
 import os
 from config import Config
-from services import labeling_service
+from services import labeling_service, dedup_service, label_store_service
 from flask import send_file
 
 label_bp = Blueprint('label', __name__)
@@ -27,9 +27,35 @@ def save_label():
     boxes = data.get('boxes') # List of {x, y, w, h, class_id}
     classes = data.get('classes') # List of strings
     
-    if labeling_service.save_annotation(filename, boxes, classes):
-        return jsonify({"status": "success"})
-    return jsonify({"status": "error"}), 500
+    try:
+        result = labeling_service.save_annotation(filename, boxes, classes,
+                                                  base_version=data.get('base_version'),
+                                                  author=data.get('client_id'))
+    except label_store_service.VersionConflict as e:
+        # 其他人已经修改过，返回服务端的最新标注，由前端重新加载
+        return jsonify({"status": "conflict", "message": str(e), **e.current,
+                        "classes": label_store_service.get_classes()}), 409
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify({"status": "success", **result})
+
+@label_bp.route('/api/labels/<path:filename>')
+def get_labels(filename):
+    return jsonify(label_store_service.get(filename))
+
+@label_bp.route('/api/labels/<path:filename>/history')
+def get_label_history(filename):
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({"history": label_store_service.get_history(filename, limit)})
+
+@label_bp.route('/api/labels/<path:filename>/undo', methods=['POST'])
+def undo_label(filename):
+    data = request.json or {}
+    try:
+        result = label_store_service.undo(filename, author=data.get('client_id'))
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify({"status": "success", **result})
 
 @label_bp.route('/api/upload_raw', methods=['POST'])
 def upload_raw():
@@ -40,8 +66,23 @@ def upload_raw():
     
     path = os.path.join(labeling_service.RAW_IMAGES_DIR, file.filename)
     file.save(path)
+
+    # 近重复检测 (视频相邻帧等)
+    if Config.DEDUP_MODE != 'off':
+        duplicate_of, distance = dedup_service.check_upload(labeling_service.RAW_IMAGES_DIR, path,
+                                                             skip=Config.DEDUP_MODE == 'skip')
+        if duplicate_of:
+            if Config.DEDUP_MODE == 'skip':
+                os.remove(path)
+                return jsonify({"status": "duplicate", "duplicate_of": duplicate_of, "distance": distance})
+            return jsonify({"status": "success", "duplicate_of": duplicate_of, "distance": distance})
     return jsonify({"status": "success"})
 
+@label_bp.route('/api/duplicates')
+def get_duplicates():
+    groups = dedup_service.find_duplicate_groups(labeling_service.RAW_IMAGES_DIR)
+    return jsonify({"groups": groups, "count": sum(len(g) - 1 for g in groups)})
+
 @label_bp.route('/api/export_dataset')
 def export_dataset():
     try:
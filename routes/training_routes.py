@@ -1,5 +1,8 @@
+import os
+import json
 from flask import Blueprint, request, jsonify, render_template
-from services import training_service
+from config import Config
+from services import training_service, sweep_service, dataset_service, artifact_service
 
 train_bp = Blueprint('train', __name__)
 
@@ -28,6 +31,12 @@ def start_training():
             "optimizer": request.form.get('optimizer'),
             "cos_lr": request.form.get('cos_lr'),
             
+            # CPU 数据并行 (进程数 / 节点数 / rendezvous，留空使用 Config 默认值)
+            "nproc": request.form.get('nproc'),
+            "nnodes": request.form.get('nnodes'),
+            "master_addr": request.form.get('master_addr'),
+            "master_port": request.form.get('master_port'),
+            
             # 数据增强 (Augmentation)
             "mosaic": request.form.get('mosaic'),
             "mixup": request.form.get('mixup'),
@@ -37,7 +46,8 @@ def start_training():
         }
 
         training_service.start_training_task(
-            file, model_name, epochs, batch, imgsz, project_name, extra_args
+            file, model_name, epochs, batch, imgsz, project_name, extra_args,
+            upload_id=request.form.get('upload_id')
         )
         return jsonify({"status": "success"})
     except Exception as e:
@@ -56,10 +66,11 @@ def get_val_image():
     pred_img = os.path.join(base_path, 'val_batch0_pred.jpg')
     label_img = os.path.join(base_path, 'val_batch0_labels.jpg')
     
+    # 带 ETag 下发: 前端每隔几秒轮询，图片没变时只返回 304
     if os.path.exists(pred_img):
-        return send_file(pred_img, mimetype='image/jpeg')
+        return artifact_service.send(pred_img, mimetype='image/jpeg')
     elif os.path.exists(label_img):
-        return send_file(label_img, mimetype='image/jpeg')
+        return artifact_service.send(label_img, mimetype='image/jpeg')
     else:
         return "", 404 # 图片还没生成
 
@@ -89,4 +100,51 @@ def get_progress():
     project_name = request.args.get('project_name')
     if not project_name: return jsonify({})
     data = training_service.get_latest_metrics(project_name)
-    return jsonify(data if data else {})
\ No newline at end of file
+    return jsonify(data if data else {})
+
+# === 数据集校验统计 (解码缓存命中、每个 epoch 预计节省的时间) ===
+@train_bp.route('/api/dataset_stats')
+def dataset_stats():
+    stats = dataset_service.get_dataset_stats(request.args.get('name', ''))
+    if stats: return jsonify(stats)
+    return jsonify({"status": "waiting"})
+
+# === 超参数搜索 (Sweep) ===
+@train_bp.route('/api/sweep/start', methods=['POST'])
+def start_sweep():
+    try:
+        # space 为 JSON 字符串，例如 {"mosaic": [0.5, 1.0], "lr0": {"min": 0.001, "max": 0.02, "log": true}}
+        space = json.loads(request.form.get('space', '{}'))
+        extra_args = {k: request.form.get(k) for k in ['device', 'workers', 'patience', 'optimizer', 'cos_lr']}
+        seed = request.form.get('seed')
+
+        record = sweep_service.start_sweep(
+            request.files.get('dataset'),
+            request.form.get('sweep_name'),
+            request.form.get('model_name', 'yolo11n.pt'),
+            int(request.form.get('epochs', 50)),
+            request.form.get('batch', 16),
+            request.form.get('imgsz', 640),
+            space,
+            strategy=request.form.get('strategy', 'random'),
+            n_trials=int(request.form.get('n_trials', 10)),
+            eta=int(request.form.get('eta', 3)),
+            min_epochs=int(request.form.get('min_epochs', 5)),
+            early_stop=request.form.get('early_stop', 'True') == 'True',
+            extra_args=extra_args,
+            seed=int(seed) if seed else None,
+            upload_id=request.form.get('upload_id')
+        )
+        return jsonify({"status": "success", "trials": len(record['trials'])})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+@train_bp.route('/api/sweep/status')
+def sweep_status():
+    record = sweep_service.get_sweep(request.args.get('name', ''))
+    if record: return jsonify(record)
+    return jsonify({"status": "error", "message": "sweep 不存在"}), 404
+
+@train_bp.route('/api/sweeps')
+def list_sweeps():
+    return jsonify(sweep_service.list_sweeps())
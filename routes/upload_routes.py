@@ -0,0 +1,43 @@
+from flask import Blueprint, request, jsonify
+from services import upload_service
+
+upload_bp = Blueprint('upload', __name__)
+
+# === 分块断点续传 (大数据集 Zip / 长视频) ===
+@upload_bp.route('/api/upload/init', methods=['POST'])
+def init_upload():
+    data = request.json or request.form
+    try:
+        status = upload_service.init_upload(
+            data.get('filename'), data.get('size', 0),
+            data.get('chunk_size', 8 * 1024 * 1024), data.get('sha256')
+        )
+        return jsonify({"status": "success", **status})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+@upload_bp.route('/api/upload/<upload_id>/chunk/<int:index>', methods=['PUT'])
+def upload_chunk(upload_id, index):
+    # 请求体就是原始的块数据，X-Chunk-SHA256 为可选的块校验值
+    try:
+        status = upload_service.write_chunk(upload_id, index, request.stream,
+                                            request.headers.get('X-Chunk-SHA256'))
+        return jsonify({"status": "success", "received": len(status['received']),
+                        "total_chunks": status['total_chunks']})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+@upload_bp.route('/api/upload/<upload_id>')
+def upload_status(upload_id):
+    try:
+        return jsonify(upload_service.get_status(upload_id))
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
+
+@upload_bp.route('/api/upload/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    try:
+        data = request.get_json(silent=True) or {}
+        return jsonify({"status": "success", **upload_service.complete_upload(upload_id, data.get('sha256'))})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
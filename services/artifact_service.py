@@ -0,0 +1,195 @@
+import os
+import shutil
+import hashlib
+import threading
+import subprocess
+from flask import send_file
+from werkzeug.security import safe_join
+from config import Config
+from services import startup_service, metrics_service
+
+# ================= 训练 / 推理产物服务 =================
+# runs/<name> 和 static/results 下的文件统一从这里下发:
+#   - send():      Werkzeug 的条件响应，支持 Range (206，视频拖动只下载需要的部分) 和 ETag (未修改返回 304)
+#                  ETag 由文件大小 + 修改时间生成，不读文件内容；训练中的 results.png 等每次都会重新验证
+#   - list_dir():  目录分页，只对当前页的条目调用 stat
+#   - thumbnail(): 第一次请求时才生成缩略图 (cv2)，按 源文件路径 + 大小 + 修改时间 缓存到 cache/thumbs
+#   - hls():       大视频在后台用 ffmpeg 无损切片 (-c copy，不重新编码) 为 HLS，切片完成前前端仍使用 Range 播放 mp4
+
+ROOTS = {"runs": Config.RUNS_FOLDER, "results": Config.RESULT_FOLDER}
+THUMB_DIR = os.path.join(Config.CACHE_FOLDER, 'thumbs')
+HLS_DIR = os.path.join(Config.CACHE_FOLDER, 'hls')
+
+IMAGE_EXTS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+VIDEO_EXTS = {'.mp4', '.avi', '.mov', '.mkv'}
+HLS_MIMETYPES = {'.m3u8': 'application/vnd.apple.mpegurl', '.ts': 'video/mp2t'}
+
+_gen_locks = {}
+_gen_locks_lock = threading.Lock()
+_hls_jobs = {}  # 切片目录 -> {"state": processing / error, "error"}
+
+def resolve(root, rel_path=''):
+    """ 把 (root, 相对路径) 解析为绝对路径，越界或不存在时返回 None """
+    base = ROOTS.get(root)
+    if base is None: return None
+    path = safe_join(base, rel_path) if rel_path else base
+    if path is None or not os.path.exists(path): return None
+    return path
+
+def kind_of(name):
+    ext = os.path.splitext(name)[1].lower()
+    if ext in IMAGE_EXTS: return 'image'
+    if ext in VIDEO_EXTS: return 'video'
+    return 'file'
+
+def _tag(path):
+    st = os.stat(path)
+    return f"{st.st_size:x}-{st.st_mtime_ns:x}"
+
+def _cache_prefix(path):
+    """ 同一个源文件的所有缓存版本共用前缀，生成新版本时删除旧版本 """
+    return hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:16]
+
+def _drop_stale(folder, prefix, keep):
+    for name in os.listdir(folder):
+        if name.startswith(prefix + '_') and name != keep:
+            path = os.path.join(folder, name)
+            if os.path.isdir(path): shutil.rmtree(path, ignore_errors=True)
+            else: os.remove(path)
+
+def _lock_for(key):
+    with _gen_locks_lock:
+        return _gen_locks.setdefault(key, threading.Lock())
+
+# ---------- 下发 ----------
+def send(path, mimetype=None):
+    """ 支持 Range / If-None-Match 的文件响应 """
+    mimetype = mimetype or HLS_MIMETYPES.get(os.path.splitext(path)[1].lower())
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=_tag(path))
+    metrics_service.inc('yolo_artifact_responses_total', status=str(response.status_code))
+    return response
+
+# ---------- 目录 ----------
+@metrics_service.instrument('artifact_list')
+def list_dir(root, rel_path='', page=1, page_size=None, sort='name'):
+    """ 返回 {entries, total, page, pages}，目录排在前面；sort: name / mtime (最新在前) / size (最大在前) """
+    path = resolve(root, rel_path)
+    if path is None or not os.path.isdir(path): return None
+    page_size = max(1, min(int(page_size or Config.ARTIFACT_PAGE_SIZE), 500))
+    page = max(1, int(page))
+
+    with os.scandir(path) as it:
+        items = [e for e in it if not e.name.startswith('.')]
+    if sort in ('mtime', 'size'):
+        attr = 'st_mtime' if sort == 'mtime' else 'st_size'
+        items.sort(key=lambda e: (not e.is_dir(), -getattr(e.stat(), attr)))
+    else:
+        items.sort(key=lambda e: (not e.is_dir(), e.name.lower()))
+
+    total = len(items)
+    entries = []
+    for e in items[(page - 1) * page_size:page * page_size]:
+        st = e.stat()
+        rel = f"{rel_path.strip('/')}/{e.name}".lstrip('/')
+        kind = 'dir' if e.is_dir() else kind_of(e.name)
+        entry = {"name": e.name, "path": rel, "kind": kind, "mtime": st.st_mtime,
+                 "size": None if kind == 'dir' else st.st_size}
+        if kind != 'dir': entry['url'] = f"/artifacts/{root}/{rel}"
+        if kind in ('image', 'video'): entry['thumb'] = f"/artifacts/thumb/{root}/{rel}"
+        if kind == 'video': entry['hls'] = st.st_size >= Config.HLS_MIN_MB * 1024 * 1024
+        entries.append(entry)
+    return {"root": root, "path": rel_path, "entries": entries, "total": total,
+            "page": page, "page_size": page_size, "pages": (total + page_size - 1) // page_size}
+
+# ---------- 缩略图 ----------
+def thumbnail(root, rel_path, size=None):
+    """ 返回缩略图路径 (没有时生成)，源文件不存在返回 None """
+    src = resolve(root, rel_path)
+    if src is None or os.path.isdir(src): return None
+    size = max(32, min(int(size or Config.THUMB_SIZE), 1024))
+    prefix = _cache_prefix(src)
+    name = f"{prefix}_{_tag(src)}_{size}.jpg"
+    out = os.path.join(THUMB_DIR, name)
+    if os.path.exists(out):
+        metrics_service.inc('yolo_artifact_thumbs_total', result='hit')
+        return out
+
+    with _lock_for(out):
+        if os.path.exists(out): return out
+        metrics_service.inc('yolo_artifact_thumbs_total', result='miss')
+        with metrics_service.track('artifact_thumb'):
+            cv2 = startup_service.lazy_import('cv2')
+            if kind_of(src) == 'video':
+                cap = cv2.VideoCapture(src)
+                ok, img = cap.read()
+                cap.release()
+                if not ok: img = None
+            else:
+                img = cv2.imread(src)
+            if img is None: raise Exception(f"无法读取 {rel_path}")
+            h, w = img.shape[:2]
+            scale = size / max(h, w)
+            if scale < 1:
+                img = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+            os.makedirs(THUMB_DIR, exist_ok=True)
+            tmp = out + '.tmp.jpg'
+            cv2.imwrite(tmp, img, [cv2.IMWRITE_JPEG_QUALITY, 80])
+            os.replace(tmp, out)
+        _drop_stale(THUMB_DIR, prefix, name)
+    with _gen_locks_lock:
+        _gen_locks.pop(out, None)
+    return out
+
+# ---------- HLS 切片 ----------
+def _segment(src, out_dir):
+    tmp_dir = out_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    cmd = ["ffmpeg", "-y", "-i", src, "-c", "copy", "-f", "hls",
+           "-hls_time", str(Config.HLS_SEGMENT_SECONDS), "-hls_playlist_type", "vod",
+           "-hls_segment_filename", os.path.join(tmp_dir, 'seg_%05d.ts'),
+           os.path.join(tmp_dir, 'index.m3u8')]
+    try:
+        with metrics_service.track('hls_segment'):
+            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            lines = result.stderr.decode('utf-8', 'ignore').strip().splitlines()
+            raise Exception(lines[-1] if lines else "ffmpeg 失败")
+        os.replace(tmp_dir, out_dir)
+        _drop_stale(HLS_DIR, os.path.basename(out_dir).split('_')[0], os.path.basename(out_dir))
+        _hls_jobs.pop(out_dir, None)
+        print(f"🎞️ HLS 切片完成: {os.path.basename(src)}")
+    except Exception as e:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        _hls_jobs[out_dir] = {"state": "error", "error": str(e)}
+        print(f"⚠️ HLS 切片失败 {os.path.basename(src)}: {e}")
+
+def hls(root, rel_path):
+    """
+    查询 (必要时在后台启动) 视频的 HLS 切片
+    返回 {"state": ready / processing / error / skipped, "playlist"}；源文件不存在返回 None
+    """
+    src = resolve(root, rel_path)
+    if src is None or kind_of(src) != 'video': return None
+    if os.path.getsize(src) < Config.HLS_MIN_MB * 1024 * 1024:
+        return {"state": "skipped"}  # 小视频直接用 Range 播放
+    key = f"{_cache_prefix(src)}_{_tag(src)}"
+    out_dir = os.path.join(HLS_DIR, key)
+    if os.path.exists(os.path.join(out_dir, 'index.m3u8')):
+        return {"state": "ready", "playlist": f"/artifacts/hls/{key}/index.m3u8"}
+
+    with _lock_for(out_dir):
+        job = _hls_jobs.get(out_dir)
+        if job is None:
+            job = _hls_jobs[out_dir] = {"state": "processing"}
+            os.makedirs(HLS_DIR, exist_ok=True)
+            thread = threading.Thread(target=_segment, args=(src, out_dir))
+            thread.daemon = True
+            thread.start()
+    return dict(job)
+
+def hls_file(key, name):
+    """ 切片目录中的 playlist / 分段文件路径 """
+    path = safe_join(HLS_DIR, key, name)
+    if path is None or not os.path.isfile(path): return None
+    return path
@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from config import Config
+
+# 推理结果缓存: key = (媒体内容 hash, 模型路径 + mtime, conf, imgsz)
+# 检测结果和元数据存在 cache/result_index.json，标注后的图片/视频仍放在 static/results 下直接由前端访问
+INDEX_PATH = os.path.join(Config.CACHE_FOLDER, 'result_index.json')
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # key -> entry，按最近访问排序 (末尾最新)
+_stats = {"hits": 0, "misses": 0, "saved_seconds": 0.0}
+_loaded = False
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """ 分块计算文件内容的 sha256，避免大视频一次性读入内存 """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def make_key(media_hash, model_path, conf_thres, imgsz):
+    """ 模型文件被覆盖 (重新训练 best.pt) 后 mtime 变化，旧缓存自然失效 """
+    model_file = model_path if os.path.isabs(model_path) else os.path.join(Config.BASE_DIR, model_path)
+    model_mtime = os.path.getmtime(model_file) if os.path.exists(model_file) else 0
+    raw = f"{media_hash}|{model_path}|{model_mtime}|{float(conf_thres)}|{int(imgsz)}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def _load():
+    global _loaded
+    if _loaded: return
+    _loaded = True
+    if not os.path.exists(INDEX_PATH): return
+    try:
+        with open(INDEX_PATH, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for entry in sorted(data.get('entries', []), key=lambda e: e['last_access']):
+            _entries[entry['key']] = entry
+        _stats.update(data.get('stats', {}))
+    except Exception as e:
+        print(f"⚠️ 结果缓存索引损坏，已忽略: {e}")
+
+def _save():
+    os.makedirs(Config.CACHE_FOLDER, exist_ok=True)
+    tmp_path = INDEX_PATH + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"entries": list(_entries.values()), "stats": _stats}, f, ensure_ascii=False)
+    os.replace(tmp_path, INDEX_PATH)
+
+def _output_path(entry):
+    # entry['result'] 形如 "results/xxx.jpg"，相对于 static 目录
+    return os.path.join(os.path.dirname(Config.RESULT_FOLDER), entry['result'])
+
+def get(key):
+    """ 命中返回 (result_url, detections, is_video)，未命中返回 None """
+    with _lock:
+        _load()
+        entry = _entries.get(key)
+        # 输出文件可能已被"清理缓存"删除，此时视为未命中
+        if entry is None or not os.path.exists(_output_path(entry)):
+            _stats["misses"] += 1
+            # 普通未命中不写索引 (miss 计数随下一次写入落盘)，只有删除了失效条目时才需要保存
+            if entry is not None:
+                del _entries[key]
+                _save()
+            return None
+
+        entry['last_access'] = time.time()
+        entry['hits'] = entry.get('hits', 0) + 1
+        _entries.move_to_end(key)
+        _stats["hits"] += 1
+        _stats["saved_seconds"] += entry['compute_seconds']
+        _save()
+        return entry['result'], entry['detections'], entry['is_video']
+
+def put(key, result_url, detections, is_video, compute_seconds):
+    with _lock:
+        _load()
+        entry = {
+            "key": key,
+            "result": result_url,
+            "detections": detections,
+            "is_video": is_video,
+            "compute_seconds": round(compute_seconds, 3),
+            "created": time.time(),
+            "last_access": time.time(),
+            "hits": 0
+        }
+        path = _output_path(entry)
+        entry["size"] = os.path.getsize(path) if os.path.exists(path) else 0
+        _entries[key] = entry
+        _entries.move_to_end(key)
+        _evict()
+        _save()
+
+def _evict():
+    """ LRU 淘汰: 缓存总大小超过上限时，从最久未访问的条目开始删除 """
+    max_bytes = Config.RESULT_CACHE_MAX_MB * 1024 * 1024
+    total = sum(e.get('size', 0) for e in _entries.values())
+    while total > max_bytes and len(_entries) > 1:
+        _, oldest = _entries.popitem(last=False)
+        total -= oldest.get('size', 0)
+        try:
+            path = _output_path(oldest)
+            if os.path.exists(path): os.remove(path)
+        except Exception as e:
+            print(e)
+
+def get_stats():
+    """ 供仪表盘展示: 命中率、节省的计算时间、缓存占用 """
+    with _lock:
+        _load()
+        total = _stats["hits"] + _stats["misses"]
+        return {
+            "cache_entries": len(_entries),
+            "cache_hits": _stats["hits"],
+            "cache_hit_rate": round(_stats["hits"] / total * 100, 1) if total else 0.0,
+            "cache_saved_seconds": round(_stats["saved_seconds"], 1),
+            "cache_size": round(sum(e.get('size', 0) for e in _entries.values()) / (1024 * 1024), 1)  # MB
+        }
@@ -1,9 +1,36 @@
 import os
 import shutil
-import pandas as pd
 from config import Config
-from services import system_service
+from services import cache_service, metrics_service, packed_service
 
+# 计入磁盘占用的目录 (保留策略也按这几个目录分别统计)
+DISK_FOLDERS = {
+    "uploads": Config.UPLOAD_FOLDER,
+    "results": Config.RESULT_FOLDER,
+    "runs": Config.RUNS_FOLDER,
+    "datasets": Config.DATASET_FOLDER
+}
+
+def scan_usage(path):
+    """
+    统计文件或目录的占用，返回 (字节数, 最近修改时间)
+    符号链接不计入 (数据集里指向 cache/images 的解码缓存链接)
+    """
+    if not os.path.exists(path): return 0, 0
+    if not os.path.isdir(path):
+        st = os.lstat(path)
+        return (0 if os.path.islink(path) else st.st_size), st.st_mtime
+    total_size, latest = 0, os.path.getmtime(path)
+    for dirpath, dirnames, filenames in os.walk(path):
+        for f in filenames:
+            fp = os.path.join(dirpath, f)
+            if not os.path.islink(fp):
+                st = os.stat(fp)
+                total_size += st.st_size
+                latest = max(latest, st.st_mtime)
+    return total_size, latest
+
+@metrics_service.instrument('dashboard_stats')
 def get_global_stats():
     """获取全局统计信息"""
     stats = {
@@ -32,10 +59,9 @@ def get_global_stats():
             csv_path = os.path.join(runs_dir, run, 'results.csv')
             if os.path.exists(csv_path):
                 try:
-                    df = pd.read_csv(csv_path)
-                    df.columns = [c.strip() for c in df.columns]
+                    results = packed_service.load_results(csv_path)
                     # 获取该次训练的最大 mAP50
-                    current_max = df['metrics/mAP50(B)'].max()
+                    current_max = float(results['metrics/mAP50(B)'].max())
                     if current_max > max_map:
                         max_map = current_max
                 except:
@@ -49,18 +75,18 @@ def get_global_stats():
 
     # 4. 磁盘占用 (static文件夹)
     total_size = 0
-    for folder in [Config.UPLOAD_FOLDER, Config.RESULT_FOLDER, Config.RUNS_FOLDER, Config.DATASET_FOLDER]:
-        if os.path.exists(folder):
-            for dirpath, dirnames, filenames in os.walk(folder):
-                for f in filenames:
-                    fp = os.path.join(dirpath, f)
-                    if not os.path.islink(fp):
-                        total_size += os.path.getsize(fp)
+    with metrics_service.track('disk_scan'):
+        for folder in DISK_FOLDERS.values():
+            total_size += scan_usage(folder)[0]
     
     stats["disk_usage"] = round(total_size / (1024 * 1024), 1) # MB
+
+    # 5. 推理结果缓存 (命中率 / 节省的计算时间)
+    stats.update(cache_service.get_stats())
     
     return stats
 
+@metrics_service.instrument('training_history')
 def get_training_history():
     """获取所有训练任务的简报列表"""
     history = []
@@ -81,10 +107,9 @@ def get_training_history():
         
         if os.path.exists(csv_path):
             try:
-                df = pd.read_csv(csv_path)
-                df.columns = [c.strip() for c in df.columns]
-                item["epochs"] = len(df)
-                item["last_map"] = round(df.iloc[-1]['metrics/mAP50(B)'] * 100, 2)
+                results = packed_service.load_results(csv_path)
+                item["epochs"] = len(results['epoch'])
+                item["last_map"] = round(float(results['metrics/mAP50(B)'][-1]) * 100, 2)
                 item["status"] = "Completed" # 简单判断，有csv就算完成
             except:
                 item["status"] = "Error"
@@ -95,6 +120,7 @@ def get_training_history():
     
     return history
 
+@metrics_service.instrument('clear_cache')
 def clear_cache_files():
     """清理临时上传和结果文件"""
     cleared_count = 0
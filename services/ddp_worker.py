@@ -0,0 +1,208 @@
+"""
+CPU 数据并行训练的 worker，由 torch.distributed.run (torchrun) 为每个 rank 启动一个进程:
+    python -m torch.distributed.run --nproc-per-node=2 ... services/ddp_worker.py '<json>'
+
+Ultralytics 自带的 DDP 只支持 CUDA (nccl、torch.cuda.set_device、device_ids=[RANK])，这里自己处理:
+  - gloo 进程组 (env:// 由 torchrun 设置 MASTER_ADDR / MASTER_PORT / RANK / WORLD_SIZE)
+  - 训练开始前从 rank 0 广播权重 (Ultralytics 每个 rank 用不同的随机种子初始化)
+  - 训练集按 rank 切分 (DistributedSampler)，每个 rank 的 batch = batch // WORLD_SIZE
+  - optimizer_step 前把所有梯度拼成一个 buffer 做一次 all_reduce (求和，与 Ultralytics DDP 的 loss 缩放一致)
+  - 每个 epoch 结束时汇总所有 rank 的训练 loss 写进 rank 0 的 results.csv，各 rank 的明细写到 ranks.csv
+  - 某个 rank 挂掉时 torchrun 会重启整组进程 (--max-restarts)，重启后从 rank 0 的 last.pt 恢复
+只有 rank 0 保存权重 / 验证 / 写 results.csv，输出前缀 [rank N] 方便在训练日志里区分
+
+独立脚本，不导入 services 包 (torchrun 以文件路径启动，工作目录不一定是项目根目录)
+"""
+import os
+import sys
+import json
+import time
+from datetime import timedelta
+
+RANK = int(os.environ.get('RANK', 0))
+WORLD_SIZE = int(os.environ.get('WORLD_SIZE', 1))
+LOCAL_WORLD_SIZE = int(os.environ.get('LOCAL_WORLD_SIZE', 1))
+RESTART_COUNT = int(os.environ.get('TORCHELASTIC_RESTART_COUNT', 0))
+
+class _RankPrefix:
+    """ 给每一行输出加上 [rank N] 前缀 (tqdm 用 \\r 刷新，同样视为新行) """
+    def __init__(self, stream, prefix):
+        self.stream = stream
+        self.prefix = prefix
+        self.line_start = True
+
+    def write(self, s):
+        out = []
+        for part in s.splitlines(keepends=True):
+            if self.line_start: out.append(self.prefix)
+            out.append(part)
+            self.line_start = part.endswith(('\n', '\r'))
+        self.stream.write(''.join(out))
+        return len(s)
+
+    def flush(self):
+        self.stream.flush()
+
+    def isatty(self):
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+def _value(v):
+    """ 和 yolo 命令行一样把 key=value 中的字符串转成 int / float / bool """
+    for cast in (int, float):
+        try:
+            return cast(v)
+        except ValueError:
+            pass
+    return {'true': True, 'false': False, 'none': None}.get(v.lower(), v)
+
+def sync_gradients(params):
+    """ 所有梯度拼成一个连续 buffer，一次 all_reduce 求和后写回 """
+    import torch
+    import torch.distributed as dist
+    grads = [p.grad for p in params if p.grad is not None]
+    if not grads: return
+    flat = torch.cat([g.reshape(-1) for g in grads])
+    dist.all_reduce(flat)
+    offset = 0
+    for g in grads:
+        n = g.numel()
+        g.copy_(flat[offset:offset + n].view_as(g))
+        offset += n
+
+def gather_rows(row):
+    """ all_gather 每个 rank 的一行 (loss + 耗时)，返回 [world_size, len(row)]，各 rank 得到相同结果 """
+    import torch
+    import torch.distributed as dist
+    gathered = [torch.zeros_like(row) for _ in range(dist.get_world_size())]
+    dist.all_gather(gathered, row)
+    return torch.stack(gathered)
+
+def broadcast_weights(module):
+    import torch.distributed as dist
+    for t in list(module.parameters()) + list(module.buffers()):
+        dist.broadcast(t.data, src=0)
+
+def _train(args):
+    import torch
+    from ultralytics.models.yolo.detect import DetectionTrainer
+
+    overrides = dict(kv.split('=', 1) for kv in args['train_args'])
+    overrides = {k: _value(v) for k, v in overrides.items()}
+    overrides['device'] = 'cpu'
+    last = args['last']
+    if args.get('resume') or (RESTART_COUNT > 0 and os.path.exists(last)):
+        if RESTART_COUNT > 0: print(f"🔁 第 {RESTART_COUNT} 次重启，从 {last} 恢复")
+        overrides = {'model': last, 'resume': last, 'device': 'cpu'}
+
+    class GlooTrainer(DetectionTrainer):
+        def get_dataloader(self, dataset_path, batch_size=16, rank=0, mode="train"):
+            if mode == "train": batch_size = max(batch_size // WORLD_SIZE, 1)
+            return super().get_dataloader(dataset_path, batch_size, rank, mode)
+
+        def optimizer_step(self):
+            sync_gradients(self.model.parameters())
+            super().optimizer_step()
+
+    epoch_start = {}
+
+    def on_epoch_start(trainer):
+        epoch_start['t'] = time.time()
+
+    def on_epoch_end(trainer):
+        """ 汇总各 rank 本 epoch 的平均 loss，rank 0 随后把均值写入 results.csv """
+        # loss_names 只在 rank 0 (get_validator) 中设置，长度以 tloss 为准
+        loss = trainer.tloss.detach().float().reshape(-1) if trainer.tloss is not None else torch.zeros(3)
+        n = loss.numel()
+        row = torch.cat([loss, torch.tensor([time.time() - epoch_start.get('t', time.time())])])
+        gathered = gather_rows(row)
+        trainer.tloss = gathered[:, :n].mean(0)
+        if RANK == 0:
+            path = os.path.join(trainer.save_dir, 'ranks.csv')
+            new = not os.path.exists(path)
+            with open(path, 'a', encoding='utf-8') as f:
+                if new: f.write(','.join(['epoch', 'rank'] + [f"train/{k}" for k in trainer.loss_names] + ['seconds']) + '\n')
+                for r, g in enumerate(gathered):
+                    f.write(','.join([str(trainer.epoch + 1), str(r)] + [f"{v:.5g}" for v in g.tolist()]) + '\n')
+
+    trainer = GlooTrainer(overrides=overrides)
+    trainer.add_callback('on_pretrain_routine_end', lambda t: broadcast_weights(t.model))
+    trainer.add_callback('on_train_epoch_start', on_epoch_start)
+    trainer.add_callback('on_train_epoch_end', on_epoch_end)
+    trainer.train()
+
+def _selftest(args):
+    """
+    不依赖数据集的自检: 线性回归，每个 rank 只看自己那份数据，
+    最后检查所有 rank 参数一致，并且和单进程全量数据训练的结果相同。
+    crash_rank 指定的 rank 在第一次运行时中途退出，用来验证 torchrun 重启整组进程。
+    """
+    import torch
+    import torch.distributed as dist
+
+    torch.manual_seed(RANK)  # 故意让各 rank 初始化不同，验证广播
+    model = torch.nn.Linear(8, 1)
+    broadcast_weights(model)
+    init = [p.detach().clone() for p in model.parameters()]
+
+    g = torch.Generator().manual_seed(0)
+    x = torch.randn(256, 8, generator=g)
+    y = x @ torch.randn(8, 1, generator=g) + 0.5
+    steps, lr = int(args.get('steps', 50)), 0.05
+
+    def loss_fn(m, xs, ys):
+        return ((m(xs) - ys) ** 2).sum() / len(x)  # 按全量样本数归一化，各 rank 求和即全量梯度
+
+    opt = torch.optim.SGD(model.parameters(), lr=lr)
+    for step in range(steps):
+        if args.get('crash_rank') == RANK and RESTART_COUNT == 0 and step == steps // 2:
+            print("💥 模拟 rank 崩溃")
+            sys.stdout.flush()
+            os._exit(1)
+        opt.zero_grad()
+        loss_fn(model, x[RANK::WORLD_SIZE], y[RANK::WORLD_SIZE]).backward()
+        sync_gradients(model.parameters())
+        opt.step()
+
+    flat = torch.cat([p.detach().reshape(-1) for p in model.parameters()])
+    ref = flat.clone()
+    dist.broadcast(ref, src=0)
+    ok = torch.allclose(flat, ref)
+
+    if RANK == 0:
+        single = torch.nn.Linear(8, 1)
+        with torch.no_grad():
+            for p, v in zip(single.parameters(), init): p.copy_(v)
+        opt = torch.optim.SGD(single.parameters(), lr=lr)
+        for _ in range(steps):
+            opt.zero_grad()
+            loss_fn(single, x, y).backward()
+            opt.step()
+        expected = torch.cat([p.detach().reshape(-1) for p in single.parameters()])
+        ok = ok and torch.allclose(flat, expected, atol=1e-5)
+        print(f"{'✅' if ok else '❌'} selftest world_size={WORLD_SIZE} restarts={RESTART_COUNT} "
+              f"loss={loss_fn(model, x, y).item():.5f}")
+    if not ok: raise SystemExit(1)
+
+def main():
+    args = json.loads(sys.argv[1])
+    sys.stdout.reconfigure(line_buffering=True)
+    sys.stdout = _RankPrefix(sys.stdout, f"[rank {RANK}] ")
+    sys.stderr = _RankPrefix(sys.stderr, f"[rank {RANK}] ")
+
+    import torch
+    import torch.distributed as dist
+    # torchrun 默认 OMP_NUM_THREADS=1，这里按本机进程数平分 CPU 核心
+    torch.set_num_threads(int(args.get('threads') or max(1, (os.cpu_count() or 1) // LOCAL_WORLD_SIZE)))
+    # rank 0 每个 epoch 结束时独自验证，其余 rank 在下一次 all_reduce 上等待，超时要足够长
+    dist.init_process_group('gloo', timeout=timedelta(seconds=int(args.get('timeout', 3600))))
+    try:
+        if args.get('selftest'): _selftest(args)
+        else: _train(args)
+    finally:
+        dist.destroy_process_group()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+import os
+import json
+import threading
+from itertools import combinations
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from services import startup_service, metrics_service
+
+# ================= 近重复图片检测 =================
+# 感知哈希: 64 位 dHash (灰度缩到 9x8，比较相邻像素亮度)，视频相邻帧的汉明距离通常只有 0~5
+# 索引: 多索引哈希 (Multi-Index Hashing)，把 64 位切成 4 段 16 位分别建倒排表。
+#   若两个哈希距离 <= r，则至少有一段的距离 <= r // 4 (抽屉原理)，
+#   查询时只需在每段枚举距离 <= r // 4 的取值，候选再用完整汉明距离确认，百万级图片也只扫很少的候选
+#   每段要枚举 sum(C(16, k), k <= r // 4) 个取值: r < 8 时最多 17 个，r = 16 时 137 个，r 越大越接近全表扫描
+
+CHUNKS = 4
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+IMG_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+def dhash(path=None, image=None):
+    """ 计算 64 位 dHash，可以传图片路径或已解码的 BGR/灰度图，无法解码时返回 None """
+    cv2 = startup_service.lazy_import('cv2')
+    if image is None:
+        # 直接以 1/4 分辨率解码灰度图，比完整解码快很多
+        image = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+        if image is None: return None
+    elif image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(image, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = 0
+    for b in bits:
+        value = (value << 1) | int(b)
+    return value
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+def _neighbors(chunk, radius):
+    """ 枚举与 chunk 汉明距离 <= radius 的所有 16 位取值 (翻转任意 k <= radius 个比特) """
+    values = [chunk]
+    for k in range(1, min(radius, CHUNK_BITS) + 1):
+        for bits in combinations(range(CHUNK_BITS), k):
+            flipped = chunk
+            for i in bits: flipped ^= 1 << i
+            values.append(flipped)
+    return values
+
+class HashIndex:
+    """ 多索引哈希表: key (文件名) -> 64 位哈希 """
+    def __init__(self):
+        self.hashes = {}
+        self.tables = [dict() for _ in range(CHUNKS)]
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _chunks(h):
+        return [(h >> (i * CHUNK_BITS)) & CHUNK_MASK for i in range(CHUNKS)]
+
+    def add(self, key, h):
+        with self.lock:
+            if key in self.hashes: self._remove(key)
+            self.hashes[key] = h
+            for table, c in zip(self.tables, self._chunks(h)):
+                table.setdefault(c, set()).add(key)
+
+    def remove(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        h = self.hashes.pop(key, None)
+        if h is None: return
+        for table, c in zip(self.tables, self._chunks(h)):
+            bucket = table.get(c)
+            if bucket:
+                bucket.discard(key)
+                if not bucket: del table[c]
+
+    def query(self, h, radius=None):
+        """ 返回 [(key, 距离)]，按距离从小到大 """
+        radius = Config.DEDUP_RADIUS if radius is None else int(radius)
+        if not 0 <= radius <= CHUNKS * CHUNK_BITS: raise Exception(f"汉明距离阈值必须在 0 ~ {CHUNKS * CHUNK_BITS} 之间: {radius}")
+        sub_radius = radius // CHUNKS
+        candidates = set()
+        with self.lock:
+            for table, c in zip(self.tables, self._chunks(h)):
+                for v in _neighbors(c, sub_radius):
+                    candidates |= table.get(v, set())
+            matches = [(k, hamming(h, self.hashes[k])) for k in candidates]
+        return sorted([m for m in matches if m[1] <= radius], key=lambda m: m[1])
+
+    def __len__(self):
+        return len(self.hashes)
+
+def hash_files(paths, workers=None):
+    """ 线程池并行计算哈希 (cv2 解码会释放 GIL)，返回 {path: hash or None} """
+    workers = workers or min(32, (os.cpu_count() or 4) * 2)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(zip(paths, pool.map(lambda p: dhash(p), paths)))
+
+def group_duplicates(hashes, radius=None):
+    """
+    把近重复的图片聚成组 (并查集)，hashes: {key: hash}
+    返回 [[key, ...], ...]，没有重复的图片自成一组
+    """
+    index = HashIndex()
+    parent = {k: k for k in hashes}
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for key, h in hashes.items():
+        if h is None: continue
+        for other, _ in index.query(h, radius):
+            parent[find(key)] = find(other)
+        index.add(key, h)
+
+    groups = {}
+    for key in hashes:
+        groups.setdefault(find(key), []).append(key)
+    return list(groups.values())
+
+# ================= raw_images 持久化索引 =================
+# 哈希结果缓存在 cache/phash_<folder>.json: {文件名: [mtime, size, hash]}，只对新增/修改过的文件重新计算
+# 上传查重 (check_upload) 只计算新文件的哈希并加入索引，改动追加到 phash_<folder>.jsonl，不扫描目录也不重写整个 json；
+# 导出和列出重复组时做完整扫描 (进程内第一次查重前也会扫描一次)，扫描后把追加记录合并进 json
+
+JOURNAL_MIN_COMPACT = 1000
+
+_folder_indexes = {}
+_folder_lock = threading.Lock()  # 只保护 _folder_indexes，每个目录另有自己的锁
+
+def _cache_path(folder):
+    return os.path.join(Config.CACHE_FOLDER, f"phash_{os.path.basename(os.path.normpath(folder))}.json")
+
+def _journal_path(folder):
+    return _cache_path(folder)[:-5] + '.jsonl'
+
+def _load_meta(folder):
+    meta = {}
+    try:
+        if os.path.exists(_cache_path(folder)):
+            with open(_cache_path(folder), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        if os.path.exists(_journal_path(folder)):
+            with open(_journal_path(folder), 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        name, sig = json.loads(line)
+                    except ValueError:
+                        continue  # 进程中途退出时最后一行可能不完整
+                    if sig is None: meta.pop(name, None)
+                    else: meta[name] = sig
+    except Exception:
+        meta = {}
+    return meta
+
+def _folder_entry(folder):
+    with _folder_lock:
+        entry = _folder_indexes.get(folder)
+        if entry is None:
+            meta = _load_meta(folder)
+            entry = _folder_indexes[folder] = {"meta": meta, "index": HashIndex(),
+                                               "lock": threading.Lock(), "scanned": False, "journal": 0}
+            for name, (_, _, h) in meta.items():
+                if h is not None: entry["index"].add(name, int(h, 16))
+        return entry
+
+@metrics_service.instrument('dedup_index')
+def get_folder_index(folder):
+    """ 完整扫描目录，增量刷新并返回哈希索引 (只重新计算新增/修改过的文件) """
+    entry = _folder_entry(folder)
+    with entry["lock"]:
+        meta, index = entry["meta"], entry["index"]
+        current = {}
+        for name in os.listdir(folder) if os.path.exists(folder) else []:
+            if not name.lower().endswith(IMG_EXTS): continue
+            st = os.stat(os.path.join(folder, name))
+            current[name] = (st.st_mtime, st.st_size)
+
+        removed = [n for n in meta if n not in current]
+        for name in removed:
+            del meta[name]
+            index.remove(name)
+        stale = [n for n, sig in current.items() if n not in meta or tuple(meta[n][:2]) != sig]
+        if stale:
+            results = hash_files([os.path.join(folder, n) for n in stale])
+            for name in stale:
+                h = results[os.path.join(folder, name)]
+                meta[name] = [current[name][0], current[name][1], f"{h:016x}" if h is not None else None]
+                if h is None: index.remove(name)
+                else: index.add(name, h)
+        if stale or removed or os.path.exists(_journal_path(folder)):
+            _save_meta(folder, meta)
+            entry["journal"] = 0
+        entry["scanned"] = True
+        return index
+
+def _save_meta(folder, meta):
+    """ 写完整的 json 并清空追加记录 """
+    os.makedirs(Config.CACHE_FOLDER, exist_ok=True)
+    path = _cache_path(folder)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(path + '.tmp', path)
+    if os.path.exists(_journal_path(folder)): os.remove(_journal_path(folder))
+
+def _append_meta(folder, entry, name, sig):
+    """ 追加一条改动；记录数超过索引大小时合并进 json (均摊下来每次上传仍是 O(1)) """
+    os.makedirs(Config.CACHE_FOLDER, exist_ok=True)
+    with open(_journal_path(folder), 'a', encoding='utf-8') as f:
+        f.write(json.dumps([name, sig]) + '\n')
+    entry["journal"] += 1
+    if entry["journal"] > max(JOURNAL_MIN_COMPACT, len(entry["meta"])):
+        _save_meta(folder, entry["meta"])
+        entry["journal"] = 0
+
+@metrics_service.instrument('dedup_check')
+def check_upload(folder, path, skip=False):
+    """
+    新上传 (已保存到 folder 中) 图片的查重，返回 (重复的已有文件名 or None, 距离)
+    只计算这一张图片的哈希并加入索引；skip=True 且发现重复时调用方会删除文件，此时不加入索引
+    """
+    entry = _folder_entry(folder)
+    if not entry["scanned"]: get_folder_index(folder)  # 进程内第一次查重: 确认缓存的索引与目录一致
+    name = os.path.basename(path)
+    st = os.stat(path)
+    h = dhash(path)  # 解码在锁外进行
+    with entry["lock"]:
+        meta, index = entry["meta"], entry["index"]
+        matches = [m for m in index.query(h) if m[0] != name] if h is not None else []
+        duplicate = (matches[0][0], matches[0][1]) if matches else (None, None)
+        if skip and duplicate[0]:
+            if name in meta:  # 覆盖了同名旧文件，旧文件已不存在
+                del meta[name]
+                index.remove(name)
+                _append_meta(folder, entry, name, None)
+            return duplicate
+        meta[name] = [st.st_mtime, st.st_size, f"{h:016x}" if h is not None else None]
+        if h is None: index.remove(name)
+        else: index.add(name, h)
+        _append_meta(folder, entry, name, meta[name])
+    return duplicate
+
+def find_duplicate_groups(folder):
+    """ 返回目录中所有近重复组 (只包含成员数 > 1 的组) """
+    index = get_folder_index(folder)
+    with index.lock:
+        hashes = dict(index.hashes)
+    groups = [sorted(g) for g in group_duplicates(hashes) if len(g) > 1]
+    return sorted(groups, key=len, reverse=True)
@@ -0,0 +1,94 @@
+import os
+import sys
+import json
+import subprocess
+from config import Config
+
+# ================= CPU 数据并行训练启动器 =================
+# 用 torch.distributed.run (torchrun) 在本机启动 nproc 个 rank (可选多个节点，gloo 后端)，每个 rank 运行 ddp_worker.py
+# torchrun 负责 rendezvous 和故障恢复: 任意 rank 退出后整组重启 (最多 max_restarts 次)，worker 从 last.pt 继续训练
+# 所有 rank 的输出都经过 torchrun 的 stdout，由 run_yolo_process 写入训练日志 (带 [rank N] 前缀)
+# 多节点时其他节点需要能访问同样路径的数据集，并手动执行日志中打印的命令
+
+WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ddp_worker.py')
+
+def get_settings(extra_args=None):
+    """ Config 默认值，可被单次训练的参数覆盖 """
+    extra_args = extra_args or {}
+    def pick(key, default, cast):
+        value = extra_args.get(key)
+        return cast(value) if value not in (None, '') else default
+    return {
+        "nproc": pick('nproc', Config.DDP_NPROC, int),
+        "nnodes": pick('nnodes', Config.DDP_NNODES, int),
+        "master_addr": pick('master_addr', Config.DDP_MASTER_ADDR, str),
+        "master_port": pick('master_port', Config.DDP_MASTER_PORT, int),
+        "rdzv_backend": pick('rdzv_backend', Config.DDP_RDZV_BACKEND, str),
+        "max_restarts": pick('max_restarts', Config.DDP_MAX_RESTARTS, int),
+        "timeout": Config.DDP_TIMEOUT
+    }
+
+def is_enabled(extra_args=None):
+    settings = get_settings(extra_args)
+    return settings['nproc'] > 1 or settings['nnodes'] > 1
+
+def build_launch_cmd(worker_args, settings, node_rank=0, run_id='yolo'):
+    """ 构造 torchrun 命令 """
+    cmd = [sys.executable, '-m', 'torch.distributed.run',
+           f"--nnodes={settings['nnodes']}",
+           f"--nproc-per-node={settings['nproc']}",
+           f"--max-restarts={settings['max_restarts']}"]
+    if settings['rdzv_backend'] == 'c10d':
+        # 动态 rendezvous，节点可以任意顺序加入 (rank 0 不一定在本机)
+        cmd += ['--rdzv-backend=c10d',
+                f"--rdzv-endpoint={settings['master_addr']}:{settings['master_port']}",
+                f"--rdzv-id={run_id}"]
+    else:
+        # 静态 rendezvous: 本机固定为 node 0，results.csv / 权重都写在本机 runs/ 下
+        cmd += [f"--node-rank={node_rank}",
+                f"--master-addr={settings['master_addr']}",
+                f"--master-port={settings['master_port']}"]
+    cmd += [WORKER, json.dumps(worker_args, ensure_ascii=False)]
+    return cmd
+
+def build_train_cmd(train_cmd, project_name, extra_args, resume=False, log=print):
+    """
+    把 build_train_cmd 生成的 yolo train 命令转换成分布式训练命令
+    train_cmd: [yolo, 'train', 'k=v', ...]；恢复训练时传 resume=True
+    """
+    settings = get_settings(extra_args)
+    last = os.path.join(Config.RUNS_FOLDER, project_name, 'weights', 'last.pt')
+    worker_args = {
+        "train_args": train_cmd[2:],
+        "last": last,
+        "resume": resume,
+        "timeout": settings['timeout']
+    }
+    cmd = build_launch_cmd(worker_args, settings, run_id=project_name)
+    log(f"🖧 CPU 数据并行: {settings['nnodes']} 节点 × {settings['nproc']} 进程 (gloo, "
+        f"{settings['rdzv_backend']} rendezvous {settings['master_addr']}:{settings['master_port']}, "
+        f"最多重启 {settings['max_restarts']} 次)\n")
+    for node in range(1, settings['nnodes']):
+        other = build_launch_cmd(worker_args, settings, node_rank=node, run_id=project_name)
+        log(f"🌐 请在节点 {node} 上执行: {' '.join(other[:-1])} '{other[-1]}'\n")
+    return cmd
+
+def run_selftest(nproc=2, crash_rank=1, max_restarts=1, port=None):
+    """
+    本机 nproc 个进程的自检: 检查梯度同步后的参数与单进程结果一致，
+    crash_rank 在第一次运行时中途退出，验证 torchrun 重启整组进程后能正常完成
+    """
+    settings = {**get_settings(), "nproc": nproc, "nnodes": 1, "rdzv_backend": 'static',
+                "master_addr": '127.0.0.1', "master_port": port or Config.DDP_MASTER_PORT + 1,
+                "max_restarts": max_restarts}
+    worker_args = {"selftest": True, "crash_rank": crash_rank, "timeout": 60}
+    cmd = build_launch_cmd(worker_args, settings, run_id='selftest')
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, timeout=300)
+    return result.returncode == 0, result.stdout
+
+if __name__ == '__main__':
+    # python -m services.distributed_service  (在项目根目录执行)
+    ok, output = run_selftest()
+    print(output)
+    print("✅ 分布式自检通过" if ok else "❌ 分布式自检失败")
+    sys.exit(0 if ok else 1)
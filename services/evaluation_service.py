@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from config import Config
+from services import startup_service, metrics_service
+
+# ================= 独立评估任务 =================
+# 任意模型 (预训练 / runs 中的 best.pt) × 任意已准备好的数据集，后台批量验证 (model.val)
+# 结果按 (模型 hash, 数据集 hash, imgsz) 缓存到 cache/eval/，重复评估直接返回
+# 任务状态: hashing (后台计算模型 / 数据集指纹) -> pending (排队) -> running -> completed / error
+
+EVAL_CACHE_DIR = os.path.join(Config.CACHE_FOLDER, 'eval')
+EVAL_RUNS_DIR = os.path.join(Config.CACHE_FOLDER, 'eval_runs')  # model.val 的输出目录，不能落在 runs/ 下被当成训练任务
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+_run_lock = threading.Lock()  # 评估会占满 GPU，同一时间只跑一个
+_hash_cache = {}              # (path, size, mtime) -> sha256，避免重复读取大模型文件
+
+def _file_hash(path):
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime)
+    if key not in _hash_cache:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        _hash_cache[key] = h.hexdigest()
+    return _hash_cache[key]
+
+def _model_file(model_path):
+    return model_path if os.path.isabs(model_path) else os.path.join(Config.BASE_DIR, model_path)
+
+def model_hash(model_path):
+    path = _model_file(model_path)
+    # 预训练模型可能还没下载到本地，此时用名字代替
+    return _file_hash(path) if os.path.exists(path) else hashlib.sha256(model_path.encode()).hexdigest()
+
+def dataset_hash(yaml_path):
+    """ data.yaml + 数据集内每个文件的 (相对路径, 大小)，标注文件再加上内容 (解压不会保留 mtime，所以不用 mtime) """
+    root = os.path.dirname(yaml_path)
+    h = hashlib.sha256()
+    with open(yaml_path, 'rb') as f: h.update(f.read())
+    for r, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith('.npy') or name in ('dataset_stats.json', 'data.yaml') or name.endswith('.cache'): continue
+            p = os.path.join(r, name)
+            h.update(f"{os.path.relpath(p, root)}:{os.path.getsize(p)}".encode())
+            if name.endswith('.txt'):
+                with open(p, 'rb') as f: h.update(f.read())
+    return h.hexdigest()
+
+def get_datasets():
+    """ 列出 datasets/ 下所有带 data.yaml 的数据集 """
+    datasets = []
+    if not os.path.exists(Config.DATASET_FOLDER): return datasets
+    for r, _, files in os.walk(Config.DATASET_FOLDER):
+        if 'data.yaml' in files:
+            yaml_path = os.path.join(r, 'data.yaml')
+            datasets.append({'name': os.path.relpath(r, Config.DATASET_FOLDER), 'path': yaml_path})
+    return datasets
+
+def _cache_path(m_hash, d_hash, imgsz):
+    return os.path.join(EVAL_CACHE_DIR, f"{m_hash[:16]}_{d_hash[:16]}_{imgsz}.json")
+
+def _run_val(model_path, yaml_path, imgsz, batch, job_id):
+    """ 调用 Ultralytics 批量验证，整理出需要的指标 """
+    YOLO = startup_service.lazy_import('ultralytics').YOLO
+    model = YOLO(model_path)
+    try:
+        with metrics_service.track('eval_val'):
+            metrics = model.val(data=yaml_path, imgsz=imgsz, batch=batch, plots=False, verbose=False,
+                                project=EVAL_RUNS_DIR, name=job_id, exist_ok=True)
+    finally:
+        # 指标都在返回值里，输出目录只有空壳 / 少量 json，用完即删
+        shutil.rmtree(os.path.join(EVAL_RUNS_DIR, job_id), ignore_errors=True)
+
+    box = metrics.box
+    names = metrics.names
+    per_class = []
+    for i, cls_idx in enumerate(box.ap_class_index):
+        per_class.append({
+            "class": names[int(cls_idx)],
+            "ap50": round(float(box.ap50[i]), 4),
+            "ap50_95": round(float(box.ap[i]), 4)
+        })
+    speed = metrics.speed  # 每张图片的毫秒数: preprocess / inference / postprocess
+    return {
+        "map50": round(float(box.map50), 4),
+        "map50_95": round(float(box.map), 4),
+        "precision": round(float(box.mp), 4),
+        "recall": round(float(box.mr), 4),
+        "per_class": per_class,
+        "latency_ms": {k: round(float(v), 2) for k, v in speed.items()},
+        "latency_total_ms": round(sum(float(v) for v in speed.values()), 2)
+    }
+
+def _load_cached(job):
+    """ 命中结果缓存时直接完成任务 """
+    path = _cache_path(job['model_hash'], job['dataset_hash'], job['imgsz'])
+    if job['force'] or not os.path.exists(path): return False
+    with open(path, 'r', encoding='utf-8') as f:
+        job['result'] = json.load(f)
+    job.update(status='completed', cached=True)
+    return True
+
+def _run_job(job):
+    try:
+        # 数据集指纹要遍历整个数据集并读取所有标注，放在后台线程，不阻塞提交请求
+        with metrics_service.track('eval_hash'):
+            job['model_hash'] = model_hash(job['model'])
+            job['dataset_hash'] = dataset_hash(job['dataset_path'])
+        if _load_cached(job): return
+        job['status'] = 'pending'
+        with _run_lock:
+            job['status'] = 'running'
+            start = time.time()
+            result = _run_val(job['model'], job['dataset_path'], job['imgsz'], job['batch'], job['id'])
+            result.update({
+                "model": job['model'], "dataset": job['dataset'], "imgsz": job['imgsz'],
+                "model_hash": job['model_hash'], "dataset_hash": job['dataset_hash'],
+                "eval_seconds": round(time.time() - start, 1), "created": time.time()
+            })
+            os.makedirs(EVAL_CACHE_DIR, exist_ok=True)
+            path = _cache_path(job['model_hash'], job['dataset_hash'], job['imgsz'])
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            os.replace(path + '.tmp', path)
+            job['result'] = result
+            job['status'] = 'completed'
+    except Exception as e:
+        job['status'] = 'error'
+        job['error'] = str(e)
+    finally:
+        job['finished'] = time.time()
+
+def start_evaluation(model_path, dataset_name, imgsz=640, batch=16, force=False):
+    """ 提交评估任务并立即返回；指纹计算、缓存查找和验证都在后台执行，通过 get_job 查询进度 """
+    dataset = next((d for d in get_datasets() if d['name'] == dataset_name), None)
+    if not dataset: raise Exception(f"未找到数据集: {dataset_name}")
+    if not model_path: raise Exception("请选择模型")
+
+    job = {
+        "id": uuid.uuid4().hex[:8], "model": model_path, "dataset": dataset_name,
+        "dataset_path": dataset['path'], "imgsz": int(imgsz), "batch": int(batch), "force": bool(force),
+        "status": "hashing", "result": None, "error": None, "cached": False,
+        "created": time.time(), "finished": None,
+        "model_hash": None, "dataset_hash": None
+    }
+    with _jobs_lock:
+        _jobs[job['id']] = job
+
+    thread = threading.Thread(target=_run_job, args=(job,))
+    thread.daemon = True
+    thread.start()
+    return job
+
+def get_job(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+def get_comparison():
+    """
+    所有缓存的评估结果，按 mAP50-95 排序，并标出精度/延迟的帕累托前沿
+    (不存在另一个结果 既更准 又更快)
+    """
+    results = []
+    if os.path.exists(EVAL_CACHE_DIR):
+        for f in os.listdir(EVAL_CACHE_DIR):
+            if not f.endswith('.json'): continue
+            try:
+                with open(os.path.join(EVAL_CACHE_DIR, f), 'r', encoding='utf-8') as fp:
+                    results.append(json.load(fp))
+            except Exception:
+                pass
+
+    for r in results:
+        r['pareto'] = not any(
+            o is not r and o['dataset_hash'] == r['dataset_hash']
+            and o['map50_95'] >= r['map50_95'] and o['latency_total_ms'] <= r['latency_total_ms']
+            and (o['map50_95'] > r['map50_95'] or o['latency_total_ms'] < r['latency_total_ms'])
+            for o in results
+        )
+        # 每毫秒延迟换来的 mAP，用于同精度下比较成本
+        r['map_per_ms'] = round(r['map50_95'] / r['latency_total_ms'], 4) if r['latency_total_ms'] else 0
+    return sorted(results, key=lambda r: (r['dataset'], -r['map50_95']))
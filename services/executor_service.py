@@ -0,0 +1,228 @@
+import os
+import time
+import queue
+import threading
+import multiprocessing
+from config import Config
+from services import startup_service, metrics_service
+
+# ================= CPU 推理执行管理器 =================
+# 多个请求同时调用 model.predict 时，每次调用都会按核心数开满 torch 的 intra-op 线程，核心被严重超订，吞吐反而下降。
+# 这里固定 N 个模型副本，每个副本是一个独立进程 (torch.set_num_threads 是进程级的，线程绑核也无法约束共享的 OpenMP 线程池):
+#   - 每个副本使用固定的线程数，并绑定到互不重叠的一组 CPU 核心 (os.sched_setaffinity)
+#   - 请求从空闲队列取一个副本，独占它完成整张图片 / 整段视频的推理后归还；没有空闲副本时排队等待
+#   - 启动时可自动调优: 依次测量不同 (副本数, 线程数) 组合的吞吐，选择最快的一组
+#   - 副本进程内 track() 的阶段耗时 (predict、plot 等) 随结果一起返回，由父进程记录，/metrics 才能看到
+# 未启用 (INFER_REPLICAS=0) 或调优尚未完成时，推理仍在请求线程内直接执行
+
+def _replica_main(replica_id, threads, cpus, conn):
+    """ 副本进程: 绑核 + 固定线程数，循环处理父进程发来的任务 """
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    # 必须在导入 torch 之前设置，OpenMP 线程池按这个值创建
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    torch = startup_service.lazy_import('torch')
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+    from services import inference_service
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None: break
+        kind, args = job
+        with metrics_service.record_stages() as stages:
+            try:
+                if kind == 'infer':
+                    result = inference_service._run_inference(*args)
+                elif kind == 'bench':
+                    result = _bench(inference_service, *args)
+                else:
+                    raise Exception(f"未知任务类型: {kind}")
+                reply = ('ok', result)
+            except Exception as e:
+                reply = ('error', str(e))
+        conn.send(reply + (stages,))
+
+def _bench(inference_service, model_path, imgsz, iters):
+    """ 调优用: 对随机图片连续推理 iters 次，返回耗时 (秒) """
+    np = startup_service.lazy_import('numpy')
+    model = inference_service.load_model(model_path)
+    image = np.random.default_rng(0).integers(0, 255, (imgsz, imgsz, 3), dtype=np.uint8)
+    start = time.perf_counter()
+    for _ in range(iters):
+        model.predict(image, verbose=False, imgsz=imgsz)
+    return time.perf_counter() - start
+
+def _available_cpus():
+    if hasattr(os, 'sched_getaffinity'): return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+class ReplicaPool:
+    """ 固定数量的推理副本进程 """
+    def __init__(self, replicas, threads, cpus=None):
+        cpus = cpus or _available_cpus()
+        self.replicas = replicas
+        self.threads = threads
+        # 核心不够分时不绑核，只限制线程数
+        self.cpu_sets = [cpus[i * threads:(i + 1) * threads] if replicas * threads <= len(cpus) else None
+                         for i in range(replicas)]
+        self._ctx = multiprocessing.get_context('spawn')  # 父进程里已经有很多线程，不能 fork
+        self._procs = [None] * replicas
+        self._conns = [None] * replicas
+        self._free = queue.Queue()
+        self._stats_lock = threading.Lock()  # submit() 在多个请求线程中并发执行
+        self.stats = {"jobs": 0, "errors": 0, "restarts": 0, "busy": 0, "wait_avg_ms": 0.0}
+
+    def _spawn(self, i):
+        parent, child = self._ctx.Pipe()
+        proc = self._ctx.Process(target=_replica_main, args=(i, self.threads, self.cpu_sets[i], child))
+        proc.daemon = True
+        proc.start()
+        child.close()
+        self._procs[i], self._conns[i] = proc, parent
+
+    def start(self):
+        for i in range(self.replicas):
+            self._spawn(i)
+            self._free.put(i)
+        return self
+
+    def stop(self):
+        for i, conn in enumerate(self._conns):
+            try:
+                conn.send(None)
+            except Exception:
+                pass
+        for proc in self._procs:
+            if proc: proc.join(timeout=5)
+            if proc and proc.is_alive(): proc.terminate()
+
+    def _call(self, i, kind, args):
+        try:
+            self._conns[i].send((kind, args))
+            status, result, stages = self._conns[i].recv()
+        except (EOFError, OSError, BrokenPipeError):
+            # 副本进程崩溃 (例如内存不足被杀)，重新拉起一个，本次请求报错
+            with self._stats_lock:
+                self.stats["restarts"] += 1
+            self._spawn(i)
+            raise Exception(f"推理副本 {i} 异常退出，已重启")
+        metrics_service.replay_stages(stages)
+        if status == 'error': raise Exception(result)
+        return result
+
+    def submit(self, kind, *args):
+        """ 阻塞直到有空闲副本，在该副本上执行任务 """
+        wait_start = time.perf_counter()
+        i = self._free.get()
+        wait = time.perf_counter() - wait_start
+        metrics_service.observe('yolo_stage_duration_seconds', wait, stage='executor_wait')
+        with self._stats_lock:
+            self.stats["busy"] += 1
+        metrics_service.gauge_add('yolo_executor_busy_replicas', 1)
+        failed = False
+        try:
+            return self._call(i, kind, args)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            with self._stats_lock:
+                n = self.stats["jobs"] = self.stats["jobs"] + 1
+                self.stats["errors"] += failed
+                self.stats["wait_avg_ms"] = round(self.stats["wait_avg_ms"] + (wait * 1000 - self.stats["wait_avg_ms"]) / n, 1)
+                self.stats["busy"] -= 1
+            metrics_service.gauge_add('yolo_executor_busy_replicas', -1)
+            self._free.put(i)
+
+    def broadcast(self, kind, *args):
+        """ 所有副本同时执行同一个任务 (调优用)，返回各副本的结果 """
+        results, errors = [None] * self.replicas, []
+        def _run(i):
+            try:
+                results[i] = self._call(i, kind, args)
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=_run, args=(i,)) for i in range(self.replicas)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        if errors: raise errors[0]
+        return results
+
+    def info(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return {"replicas": self.replicas, "threads": self.threads,
+                "cpu_sets": self.cpu_sets, "free": self._free.qsize(), **stats}
+
+_pool = None
+_status = {"state": "off", "tuning": [], "error": None}
+
+def _candidates(n_cpus):
+    """ 线程数取 1, 2, 4, ... 直到核心数，副本数 = 核心数 // 线程数 (最多 INFER_MAX_REPLICAS 个) """
+    combos, t = [], 1
+    while t <= n_cpus:
+        combos.append((min(max(1, n_cpus // t), Config.INFER_MAX_REPLICAS), t))
+        t *= 2
+    if n_cpus not in [c[1] for c in combos]: combos.append((1, n_cpus))
+    return sorted(set(combos))
+
+def autotune(model_path, imgsz=640, iters=None):
+    """ 依次启动不同组合的副本池，测量并发吞吐 (张/秒)，返回最佳 (副本数, 线程数) """
+    iters = iters or Config.INFER_AUTOTUNE_ITERS
+    best, results = None, []
+    for replicas, threads in _candidates(len(_available_cpus())):
+        pool = ReplicaPool(replicas, threads).start()
+        try:
+            pool.broadcast('bench', model_path, imgsz, 1)  # 加载模型 + 预热
+            start = time.perf_counter()
+            pool.broadcast('bench', model_path, imgsz, iters)
+            elapsed = time.perf_counter() - start
+        finally:
+            pool.stop()
+        item = {"replicas": replicas, "threads": threads,
+                "throughput": round(replicas * iters / elapsed, 2),
+                "latency_ms": round(elapsed / iters * 1000, 1)}
+        results.append(item)
+        _status["tuning"] = results
+        print(f"⚙️ 推理调优 {replicas} 副本 × {threads} 线程: {item['throughput']} 张/秒，单张 {item['latency_ms']} ms")
+        if best is None or item['throughput'] > best['throughput']: best = item
+    return best['replicas'], best['threads']
+
+def start(model_path=None):
+    """ 后台启动副本池 (需要时先自动调优) """
+    def _run():
+        global _pool
+        try:
+            replicas, threads = Config.INFER_REPLICAS, Config.INFER_THREADS
+            if Config.INFER_AUTOTUNE:
+                _status["state"] = "tuning"
+                with startup_service.timed('executor_autotune', 'init'):
+                    replicas, threads = autotune(model_path or Config.WARMUP_MODEL or 'yolo11n.pt')
+            threads = threads or max(1, len(_available_cpus()) // replicas)
+            with startup_service.timed('executor_start', 'init'):
+                _pool = ReplicaPool(replicas, threads).start()
+            _status["state"] = "ready"
+            print(f"✅ 推理执行管理器就绪: {replicas} 副本 × {threads} 线程")
+        except Exception as e:
+            _status.update(state="error", error=str(e))
+            print(f"⚠️ 推理执行管理器启动失败，推理将在请求线程内执行: {e}")
+
+    thread = threading.Thread(target=_run)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+def is_ready():
+    return _pool is not None
+
+def run_inference(*args):
+    """ 与 inference_service._run_inference 参数相同，在空闲副本上执行 """
+    with metrics_service.track('executor_run'):
+        return _pool.submit('infer', *args)
+
+def get_status():
+    return {**_status, "pool": _pool.info() if _pool else None}
@@ -1,12 +1,14 @@
 import os
-import cv2
+import time
+import threading
 import subprocess
-from ultralytics import YOLO
 from config import Config
+from services import startup_service, cache_service, metrics_service, executor_service
 
 # 全局变量存储当前加载的模型，避免每次请求都重新加载
 current_model_instance = None
 current_model_name = None
+_model_lock = threading.Lock()  # 预热线程和请求线程可能同时加载模型
 
 def get_available_models():
     """ 扫描系统中所有可用的 .pt 模型 """
@@ -36,29 +38,81 @@ def load_model(model_path):
     """ 智能加载模型 (如果已经加载过就不重新加载) """
     global current_model_instance, current_model_name
     
-    if current_model_instance is None or current_model_name != model_path:
-        print(f"🔄 切换模型为: {model_path}")
-        current_model_instance = YOLO(model_path)
-        current_model_name = model_path
+    with _model_lock:
+        if current_model_instance is None or current_model_name != model_path:
+            print(f"🔄 切换模型为: {model_path}")
+            # ultralytics 会连带导入 torch，放到第一次加载模型时再导入
+            with metrics_service.track('model_load'):
+                YOLO = startup_service.lazy_import('ultralytics').YOLO
+                current_model_instance = YOLO(model_path)
+            current_model_name = model_path
     
-    return current_model_instance
+        return current_model_instance
+
+def warmup_model(model_path):
+    """ 后台预热: 提前加载默认模型，避免第一个推理请求承担冷启动 """
+    def _run():
+        try:
+            with startup_service.timed(f"warmup:{model_path}", 'init'):
+                load_model(model_path)
+            print(f"🔥 模型预热完成: {model_path}")
+        except Exception as e:
+            print(f"⚠️ 模型预热失败: {e}")
+
+    thread = threading.Thread(target=_run)
+    thread.daemon = True
+    thread.start()
+    return thread
 
 # ... convert_to_h264 保持不变 ...
 def convert_to_h264(input_path):
     output_path = input_path.rsplit('.', 1)[0] + "_web.mp4"
     cmd = ["ffmpeg", "-y", "-i", input_path, "-c:v", "libx264", "-preset", "fast",
            "-crf", "23", "-c:a", "aac", "-movflags", "+faststart", output_path]
-    subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    with metrics_service.track('video_encode'):
+        subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     return output_path
 
-def process_media(input_path, filename, model_path, conf_thres=0.25):
-    """ 统一处理图片和视频，接收 model_path 和 conf 参数 """
+def annotate_frame(model, frame, conf_thres, imgsz=640):
+    """ 单帧推理 + 画框，返回 (标注后的图像, 检测到的类别名列表)，视频和实时流共用 """
+    with metrics_service.track('predict_frame'):
+        res = model.predict(frame, verbose=False, conf=conf_thres, imgsz=imgsz)[0]
+    names = [res.names[int(box.cls[0])] for box in res.boxes]
+    with metrics_service.track('plot_frame'):
+        annotated = res.plot()
+    return annotated, names
+
+def process_media(input_path, filename, model_path, conf_thres=0.25, imgsz=640):
+    """ 统一处理图片和视频，接收 model_path 和 conf 参数 (相同内容+模型+参数直接命中结果缓存) """
+    with metrics_service.track('media_hash'):
+        media_hash = cache_service.file_hash(input_path)
+    cache_key = cache_service.make_key(media_hash, model_path, conf_thres, imgsz)
+    cached = cache_service.get(cache_key)
+    if cached:
+        print(f"⚡ 命中结果缓存: {filename}")
+        metrics_service.inc('yolo_result_cache_total', result='hit')
+        return cached
+    metrics_service.inc('yolo_result_cache_total', result='miss')
+
+    start = time.perf_counter()
+    # 结果文件名带上 key 前缀，不同内容的同名文件不会互相覆盖
+    # 启用了执行管理器时交给空闲的模型副本，避免并发请求互相抢占 CPU 核心
+    run = executor_service.run_inference if executor_service.is_ready() else _run_inference
+    result_url, detections, is_video = run(
+        input_path, filename, model_path, conf_thres, imgsz, cache_key[:16]
+    )
+    cache_service.put(cache_key, result_url, detections, is_video, time.perf_counter() - start)
+    return result_url, detections, is_video
+
+def _run_inference(input_path, filename, model_path, conf_thres, imgsz, prefix):
+    cv2 = startup_service.lazy_import('cv2')
     model = load_model(model_path)
     ext = os.path.splitext(filename)[1].lower()
     
     # === 图片处理 ===
     if ext in ['.jpg', '.jpeg', '.png']:
-        results = model.predict(source=input_path, save=False, conf=conf_thres)
+        with metrics_service.track('predict'):
+            results = model.predict(source=input_path, save=False, conf=conf_thres, imgsz=imgsz)
         result_obj = results[0]
         
         detections = []
@@ -72,10 +126,12 @@ def process_media(input_path, filename, model_path, conf_thres=0.25):
                 "conf_float": conf * 100
             })
 
-        annotated = result_obj.plot()
-        result_filename = f"result_{filename}"
+        with metrics_service.track('plot'):
+            annotated = result_obj.plot()
+        result_filename = f"result_{prefix}_{filename}"
         result_path = os.path.join(Config.RESULT_FOLDER, result_filename)
-        cv2.imwrite(result_path, annotated)
+        with metrics_service.track('image_write'):
+            cv2.imwrite(result_path, annotated)
         
         return "results/" + result_filename, detections, False
 
@@ -86,21 +142,20 @@ def process_media(input_path, filename, model_path, conf_thres=0.25):
         height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         fps = cap.get(cv2.CAP_PROP_FPS)
         
-        tmp_path = os.path.join(Config.RESULT_FOLDER, f"tmp_{filename}")
+        tmp_path = os.path.join(Config.RESULT_FOLDER, f"tmp_{prefix}_{filename}")
         out = cv2.VideoWriter(tmp_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
         
         stats = {}
         while True:
             ret, frame = cap.read()
             if not ret: break
-            res = model.predict(frame, verbose=False, conf=conf_thres)[0]
+            annotated, names = annotate_frame(model, frame, conf_thres, imgsz)
             
-            for box in res.boxes:
-                name = res.names[int(box.cls[0])]
+            for name in names:
                 if name not in stats: stats[name] = 0
                 stats[name] += 1 # 简单计数
             
-            out.write(res.plot())
+            out.write(annotated)
         
         cap.release()
         out.release()
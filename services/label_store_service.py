@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import atexit
+import threading
+from config import Config
+from services import metrics_service
+
+# ================= 标注持久化 =================
+# 画布自动保存非常频繁，直接重写 txt 既慢又不安全 (写到一半崩溃会损坏文件，多人同时标注会互相覆盖 classes.txt)
+#   - save():   乐观锁 (客户端带上读取时的 version，不一致说明别人改过，返回冲突)，只更新内存中的最新状态
+#   - 后台线程: 某张图片最后一次修改 LABEL_SAVE_DEBOUNCE 秒后才落盘，期间的多次保存合并为一次写入:
+#               YOLO txt 原子写入 (tmp + fsync + os.replace)，并向编辑日志追加一条记录
+#   - 编辑日志: labels/.history/<图片名>.jsonl，只追加不修改，用于历史记录和撤销 (撤销本身也是一次新的编辑)
+#   - classes.txt: 只追加新类别，已有类别的序号永远不变；客户端的 class_id 按类别名映射到全局序号
+# 输出的 txt 与之前完全相同，导出和训练不受影响
+
+class VersionConflict(Exception):
+    """ 保存时的版本与服务端不一致 (其他人已经修改过这张图片) """
+    def __init__(self, current):
+        super().__init__("标注已被其他人修改，请刷新后再保存")
+        self.current = current
+
+_labels_dir = None
+_entries = {}  # 图片名 -> {boxes, version, dirty, due, author, op, initial}
+_lock = threading.Lock()
+_cond = threading.Condition(_lock)
+_classes_lock = threading.Lock()
+_write_lock = threading.Lock()  # 定时写入和立即写入可能并发，保证旧版本不会覆盖新版本
+_written = {}                   # 图片名 -> 已落盘的版本
+_flusher = None
+
+def init(labels_dir):
+    global _labels_dir
+    _labels_dir = labels_dir
+    os.makedirs(os.path.join(labels_dir, '.history'), exist_ok=True)
+
+def _txt_path(filename):
+    return os.path.join(_labels_dir, os.path.splitext(os.path.basename(filename))[0] + ".txt")
+
+def _log_path(filename):
+    return os.path.join(_labels_dir, '.history', os.path.basename(filename) + ".jsonl")
+
+def _atomic_write(path, text):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def _format_boxes(boxes):
+    # YOLO format: class_id center_x center_y width height
+    return "".join(f"{box['class_id']} {box['x']} {box['y']} {box['w']} {box['h']}\n" for box in boxes)
+
+def _read_txt(filename):
+    boxes = []
+    path = _txt_path(filename)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            for line in f:
+                parts = line.strip().split()
+                if len(parts) >= 5:
+                    boxes.append({"class_id": int(parts[0]), "x": float(parts[1]), "y": float(parts[2]),
+                                  "w": float(parts[3]), "h": float(parts[4])})
+    return boxes
+
+def _read_log(filename):
+    entries = []
+    path = _log_path(filename)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    pass  # 崩溃时可能留下不完整的最后一行
+    return entries
+
+def _entry(filename):
+    """ 取内存中的状态，没有时从 txt + 编辑日志加载 (调用方持有 _lock) """
+    name = os.path.basename(filename)
+    entry = _entries.get(name)
+    if entry is None:
+        log = _read_log(name)
+        boxes = _read_txt(name)
+        entry = _entries[name] = {"boxes": boxes, "version": log[-1]['version'] if log else 0,
+                                  "dirty": False, "due": 0, "author": None, "op": None,
+                                  "initial": None if log else boxes}  # 第一次写日志时记录原始标注，便于撤销
+    return entry
+
+# ---------- classes.txt ----------
+def get_classes():
+    path = os.path.join(_labels_dir, 'classes.txt')
+    if not os.path.exists(path): return []
+    with open(path, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def merge_classes(names):
+    """ 把客户端的类别并入 classes.txt (只追加)，返回全局类别列表 """
+    with _classes_lock:
+        current = get_classes()
+        new = [n for n in dict.fromkeys(names or []) if n and n not in current]
+        if new:
+            current += new
+            _atomic_write(os.path.join(_labels_dir, 'classes.txt'), "".join(f"{n}\n" for n in current))
+        return current
+
+# ---------- 读写 ----------
+def get(filename):
+    with _lock:
+        entry = _entry(filename)
+        return {"boxes": list(entry['boxes']), "version": entry['version'], "classes": get_classes()}
+
+def save(filename, boxes, classes=None, base_version=None, author=None, op='save'):
+    """
+    保存标注 (只更新内存，稍后合并落盘)
+    classes: 客户端的类别列表，boxes 中的 class_id 是它的下标，会映射为全局序号
+    base_version: 客户端读取时的版本，None 表示不检查
+    """
+    with _cond:
+        entry = _entry(filename)
+        if base_version is not None and int(base_version) != entry['version']:
+            metrics_service.inc('yolo_label_conflicts_total')
+            raise VersionConflict({"boxes": list(entry['boxes']), "version": entry['version']})
+        # 冲突的保存不能把类别写进 classes.txt，所以在版本检查之后合并
+        if classes is not None:
+            merged = merge_classes(classes)
+            boxes = [{**b, "class_id": merged.index(classes[int(b['class_id'])])} for b in boxes]
+        if entry['dirty']: metrics_service.inc('yolo_label_writes_coalesced_total')
+        entry.update(boxes=boxes, version=entry['version'] + 1, dirty=True, author=author, op=op,
+                     due=time.time() + Config.LABEL_SAVE_DEBOUNCE)
+        _ensure_flusher()
+        _cond.notify()
+        return {"version": entry['version'], "classes": get_classes()}
+
+def _write(name, snapshot):
+    with _write_lock, metrics_service.track('label_flush'):
+        if _written.get(name, -1) >= snapshot['version']: return
+        _atomic_write(_txt_path(name), _format_boxes(snapshot['boxes']))
+        records = []
+        if not os.path.exists(_log_path(name)):
+            records.append({"version": 0, "time": time.time(), "author": None, "op": "import",
+                            "boxes": snapshot['initial'] or []})
+        records.append({"version": snapshot['version'], "time": time.time(), "author": snapshot['author'],
+                        "op": snapshot['op'], "boxes": snapshot['boxes']})
+        with open(_log_path(name), 'a', encoding='utf-8') as f:
+            f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+            f.flush()
+            os.fsync(f.fileno())
+        _written[name] = snapshot['version']
+
+def _take_due(force=False, names=None):
+    """ 取出到期 (或强制) 的待写入快照，调用方持有 _lock """
+    now = time.time()
+    due = []
+    for name, entry in _entries.items():
+        if not entry['dirty']: continue
+        if names is not None and name not in names: continue
+        if force or entry['due'] <= now:
+            entry['dirty'] = False
+            due.append((name, {k: entry[k] for k in ('boxes', 'version', 'author', 'op', 'initial')}))
+    return due
+
+def _flush_loop():
+    while True:
+        with _cond:
+            pending = [e['due'] for e in _entries.values() if e['dirty']]
+            timeout = max(0.0, min(pending) - time.time()) if pending else None
+            _cond.wait(timeout)
+            due = _take_due()
+        for name, snapshot in due:
+            try:
+                _write(name, snapshot)
+            except Exception as e:
+                print(f"⚠️ 标注写入失败 {name}: {e}")
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None:
+        _flusher = threading.Thread(target=_flush_loop)
+        _flusher.daemon = True
+        _flusher.start()
+
+def flush(filenames=None):
+    """ 立即写入待保存的标注 (导出数据集前 / 撤销前 / 进程退出时) """
+    names = None if filenames is None else {os.path.basename(f) for f in filenames}
+    with _lock:
+        due = _take_due(force=True, names=names)
+    for name, snapshot in due:
+        _write(name, snapshot)
+    return len(due)
+
+atexit.register(flush)
+
+# ---------- 历史与撤销 ----------
+def get_history(filename, limit=50):
+    flush([filename])
+    log = _read_log(filename)
+    return [{"version": e['version'], "time": e['time'], "author": e.get('author'),
+             "op": e.get('op'), "box_count": len(e['boxes'])} for e in reversed(log[-limit:])]
+
+def undo(filename, author=None):
+    """ 回到上一次落盘的状态 (作为一次新的编辑追加到日志) """
+    flush([filename])
+    # 按日志重放出撤销栈: 普通编辑入栈，撤销出栈，栈顶就是当前状态
+    stack = []
+    for e in _read_log(filename):
+        if e.get('op') == 'undo' and len(stack) > 1: stack.pop()
+        else: stack.append(e['boxes'])
+    if len(stack) < 2: raise Exception("没有可撤销的历史记录")
+    previous = stack[-2]
+    with _lock:
+        current = _entry(filename)['version']
+    result = save(filename, previous, base_version=current, author=author, op='undo')
+    flush([filename])
+    return {**result, "boxes": previous}
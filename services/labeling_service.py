@@ -1,5 +1,6 @@
 import os
 from config import Config
+from services import metrics_service, dedup_service, label_store_service
 import shutil
 import random
 import yaml
@@ -12,7 +13,9 @@ LABELS_OUTPUT_DIR = os.path.join(Config.BASE_DIR, 'datasets', 'labels')
 # 确保目录存在
 os.makedirs(RAW_IMAGES_DIR, exist_ok=True)
 os.makedirs(LABELS_OUTPUT_DIR, exist_ok=True)
+label_store_service.init(LABELS_OUTPUT_DIR)
 
+@metrics_service.instrument('label_list')
 def get_images_list():
     """获取所有待标注图片"""
     images = []
@@ -20,13 +23,15 @@ def get_images_list():
     
     # 支持的图片格式
     valid_exts = {'.jpg', '.jpeg', '.png', '.bmp'}
+    # 一次列出所有 txt，而不是对每张图片查一次文件是否存在
+    labeled = set(os.listdir(LABELS_OUTPUT_DIR)) if os.path.exists(LABELS_OUTPUT_DIR) else set()
     
     for f in os.listdir(RAW_IMAGES_DIR):
         ext = os.path.splitext(f)[1].lower()
         if ext in valid_exts:
             # 检查是否已经标注过 (是否存在同名 txt)
             txt_name = os.path.splitext(f)[0] + ".txt"
-            is_labeled = os.path.exists(os.path.join(LABELS_OUTPUT_DIR, txt_name))
+            is_labeled = txt_name in labeled
             
             images.append({
                 "name": f,
@@ -38,54 +43,65 @@ def get_images_list():
     images.sort(key=lambda x: x['is_labeled'])
     return images
 
-def save_annotation(filename, boxes, classes):
+@metrics_service.instrument('label_save')
+def save_annotation(filename, boxes, classes, base_version=None, author=None):
     """
-    保存标注结果为 YOLO 格式 txt
+    保存标注结果为 YOLO 格式 txt (由 label_store_service 合并后原子写入)
     boxes: [{x, y, w, h, class_id}, ...] (归一化后的数据)
+    返回 {version, classes}；base_version 与服务端不一致时抛出 VersionConflict
     """
-    txt_name = os.path.splitext(filename)[0] + ".txt"
-    txt_path = os.path.join(LABELS_OUTPUT_DIR, txt_name)
-    
-    with open(txt_path, 'w') as f:
-        for box in boxes:
-            # YOLO format: class_id center_x center_y width height
-            line = f"{box['class_id']} {box['x']} {box['y']} {box['w']} {box['h']}\n"
-            f.write(line)
-            
-    # 同时保存 classes.txt 以便记录类别名称
-    classes_path = os.path.join(LABELS_OUTPUT_DIR, 'classes.txt')
-    # 只有当文件不存在或类别更新时才写（这里简化处理，覆盖写入）
-    with open(classes_path, 'w') as f:
-        for name in classes:
-            f.write(f"{name}\n")
-            
-    return True
+    return label_store_service.save(filename, boxes, classes, base_version=base_version, author=author)
 
 def get_existing_labels(filename):
-    """读取已有的标注（如果有）"""
-    txt_name = os.path.splitext(filename)[0] + ".txt"
-    txt_path = os.path.join(LABELS_OUTPUT_DIR, txt_name)
-    
-    boxes = []
-    if os.path.exists(txt_path):
-        with open(txt_path, 'r') as f:
-            for line in f:
-                parts = line.strip().split()
-                if len(parts) >= 5:
-                    boxes.append({
-                        "class_id": int(parts[0]),
-                        "x": float(parts[1]),
-                        "y": float(parts[2]),
-                        "w": float(parts[3]),
-                        "h": float(parts[4])
-                    })
-    return boxes
+    """读取已有的标注（如果有，包括尚未落盘的修改）"""
+    return label_store_service.get(filename)['boxes']
+
+SPLIT_DRIFT_WARN = 0.1  # 实际验证集比例与要求相差超过 10 个百分点时警告
 
+def _split_groups(groups, val_split):
+    """
+    把近重复组随机分到 train / val，返回 (train 文件名列表, val 文件名列表)
+    验证集至少包含一个组 (没有能放下的组时取最小的组)，train 也至少保留一个组
+    """
+    groups = list(groups)
+    random.shuffle(groups)
+    total = sum(len(g) for g in groups)
+    if len(groups) < 2:
+        # 所有图片都是同一组近重复，只能按图片切分 (验证集会与训练集高度相似)
+        names = groups[0] if groups else []
+        val_n = min(max(1, round(total * val_split)), total - 1) if total > 1 else 0
+        print("⚠️ 所有已标注图片属于同一个近重复组，只能按图片切分，验证集 mAP 会偏高")
+        return names[val_n:], names[:val_n]
+
+    val_target = min(max(1, round(total * val_split)), total - 1)
+    train_groups, val_groups, val_count = [], [], 0
+    for group in groups:
+        if val_count + len(group) <= val_target:
+            val_groups.append(group)
+            val_count += len(group)
+        else:
+            train_groups.append(group)
+    if not val_groups:
+        smallest = min(train_groups, key=len)
+        train_groups.remove(smallest)
+        val_groups.append(smallest)
+        val_count = len(smallest)
+
+    ratio = val_count / total
+    if abs(ratio - val_split) > SPLIT_DRIFT_WARN:
+        print(f"⚠️ 近重复组过大，验证集实际比例 {ratio:.0%} (要求 {val_split:.0%})，"
+              f"共 {len(groups)} 组 {total} 张，最大的组 {max(len(g) for g in groups)} 张")
+    return [n for g in train_groups for n in g], [n for g in val_groups for n in g]
+
+@metrics_service.instrument('dataset_export')
 def export_dataset_to_zip(val_split=0.2):
     """
     将标注好的数据打包成 YOLO 训练所需的 Zip 格式
     val_split: 验证集比例 (默认 20%)
     """
+    # 先把尚未落盘的标注写入 txt
+    label_store_service.flush()
+
     # 1. 准备临时目录
     export_dir = os.path.join(Config.BASE_DIR, 'temp_export')
     if os.path.exists(export_dir): shutil.rmtree(export_dir)
@@ -113,11 +129,13 @@ def export_dataset_to_zip(val_split=0.2):
     if not valid_pairs:
         raise Exception("没有找到已标注的数据！请先进行标注。")
 
-    # 3. 随机打乱并切分
-    random.shuffle(valid_pairs)
-    split_idx = int(len(valid_pairs) * (1 - val_split))
-    train_set = valid_pairs[:split_idx]
-    val_set = valid_pairs[split_idx:]
+    # 3. 按近重复组随机切分: 同一组 (如视频相邻帧) 只会整体进入 train 或 val，避免数据泄漏
+    index = dedup_service.get_folder_index(RAW_IMAGES_DIR)
+    pair_by_name = {p[2]: p for p in valid_pairs}
+    groups = dedup_service.group_duplicates({name: index.hashes.get(name) for name in pair_by_name})
+    train_set, val_set = _split_groups(groups, val_split)
+    train_set = [pair_by_name[name] for name in train_set]
+    val_set = [pair_by_name[name] for name in val_set]
     
     # 4. 复制文件
     def copy_files(dataset, split_name):
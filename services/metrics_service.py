@@ -0,0 +1,201 @@
+import os
+import sys
+import time
+import threading
+import functools
+from collections import defaultdict
+from contextlib import contextmanager
+from config import Config
+
+# ================= 指标存储 (Prometheus 文本格式导出) =================
+# 三类指标，统一按 stage 标签区分热点阶段:
+#   yolo_stage_duration_seconds  直方图 (延迟分布)
+#   yolo_stage_total             计数器 (按 status=ok/error)
+#   yolo_stage_in_flight         仪表  (当前正在执行的数量)
+# HTTP 请求使用同样的结构，前缀为 yolo_http_request_，标签为 endpoint
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+_lock = threading.Lock()
+_histograms = {}                # (metric, labels) -> {"buckets": [...], "sum": x, "count": n}
+_counters = defaultdict(float)  # (metric, labels) -> value
+_gauges = defaultdict(float)    # (metric, labels) -> value
+_recorder = threading.local()   # record_stages() 期间，本线程 track() 的耗时同时记到这里
+
+def _key(metric, labels):
+    return metric, tuple(sorted(labels.items()))
+
+def inc(metric, value=1, **labels):
+    with _lock:
+        _counters[_key(metric, labels)] += value
+
+def gauge_add(metric, value, **labels):
+    with _lock:
+        _gauges[_key(metric, labels)] += value
+
+def observe(metric, seconds, **labels):
+    with _lock:
+        k = _key(metric, labels)
+        h = _histograms.get(k)
+        if h is None:
+            h = _histograms[k] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound: h["buckets"][i] += 1
+        h["sum"] += seconds
+        h["count"] += 1
+
+@contextmanager
+def track(stage):
+    """ 统计一个阶段: with metrics_service.track('predict'): ... """
+    prefix = 'yolo_stage'
+    gauge_add(f"{prefix}_in_flight", 1, stage=stage)
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        observe(f"{prefix}_duration_seconds", elapsed, stage=stage)
+        inc(f"{prefix}_total", status=status, stage=stage)
+        gauge_add(f"{prefix}_in_flight", -1, stage=stage)
+        stages = getattr(_recorder, 'stages', None)
+        if stages is not None: stages.append((stage, elapsed, status))
+
+@contextmanager
+def record_stages():
+    """
+    收集当前线程内 track() 的阶段耗时 [(stage, 秒, status)]
+    子进程 (推理副本) 的指标只存在于子进程里，用它把耗时随结果带回父进程，再由 replay_stages() 记录
+    """
+    _recorder.stages = stages = []
+    try:
+        yield stages
+    finally:
+        _recorder.stages = None
+
+def replay_stages(stages):
+    """ 把 record_stages() 收集到的耗时记录到本进程的指标中 """
+    for stage, seconds, status in stages:
+        observe('yolo_stage_duration_seconds', seconds, stage=stage)
+        inc('yolo_stage_total', status=status, stage=stage)
+
+def instrument(stage):
+    """ 装饰器版本的 track，用于整个函数就是一个阶段的情况 """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with track(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _fmt_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items: return ""
+    escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    body = ",".join(f'{k}="{escape(v)}"' for k, v in items)
+    return "{" + body + "}"
+
+def render_prometheus():
+    """ 生成 /metrics 输出 (Prometheus text exposition format 0.0.4) """
+    lines = []
+    with _lock:
+        typed = set()
+        for (metric, labels), value in sorted(_counters.items()):
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_fmt_labels(labels)} {value}")
+
+        for (metric, labels), value in sorted(_gauges.items()):
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} gauge")
+                typed.add(metric)
+            lines.append(f"{metric}{_fmt_labels(labels)} {value}")
+
+        for (metric, labels), h in sorted(_histograms.items()):
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            # Prometheus 的 bucket 是累计值，observe 里已按 <= bound 累加
+            for bound, count in zip(BUCKETS, h["buckets"]):
+                lines.append(f"{metric}_bucket{_fmt_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{metric}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {h['count']}")
+            lines.append(f"{metric}_sum{_fmt_labels(labels)} {h['sum']}")
+            lines.append(f"{metric}_count{_fmt_labels(labels)} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+# ================= 采样分析器 (慢请求火焰图) =================
+
+class ProfilerState:
+    def __init__(self):
+        self.enabled = Config.PROFILER_ENABLED
+        self.slow_ms = Config.PROFILER_SLOW_MS
+        self.interval = 0.005  # 采样间隔 5ms
+
+profiler = ProfilerState()
+PROFILE_DIR = os.path.join(Config.CACHE_FOLDER, 'profiles')
+
+class SamplingProfiler:
+    """
+    对单个线程做栈采样，结果为 folded stacks (flamegraph.pl / speedscope 可直接读取)
+    每行: frame1;frame2;...;frameN count
+    """
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = defaultdict(int)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None: continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def dump(self, name):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        safe_name = "".join(c if c.isalnum() or c in '-_' else '_' for c in name)
+        path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d_%H%M%S')}_{safe_name}.folded")
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.items():
+                f.write(f"{stack} {count}\n")
+        return path
+
+def start_request_profiler():
+    """ 开启分析器时，为当前请求线程启动采样；未开启返回 None """
+    if not profiler.enabled: return None
+    return SamplingProfiler(threading.get_ident(), profiler.interval).start()
+
+def finish_request_profiler(sampler, name, elapsed):
+    """ 只有超过慢请求阈值的请求才落盘 """
+    if sampler is None: return None
+    sampler.stop()
+    if elapsed * 1000 < profiler.slow_ms or not sampler.stacks: return None
+    path = sampler.dump(name)
+    inc("yolo_profiler_dumps_total")
+    print(f"🐢 慢请求 {name} 耗时 {elapsed:.2f}s，栈采样已保存: {path}")
+    return path
+
+def set_profiler(enabled=None, slow_ms=None):
+    if enabled is not None: profiler.enabled = bool(enabled)
+    if slow_ms is not None: profiler.slow_ms = float(slow_ms)
+    return {"enabled": profiler.enabled, "slow_ms": profiler.slow_ms, "dir": PROFILE_DIR}
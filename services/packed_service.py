@@ -0,0 +1,311 @@
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import struct
+import tempfile
+from config import Config
+from services import startup_service, metrics_service
+
+# ================= 紧凑二进制格式 (.ypack) =================
+# 大数据集每张图片一个 txt、每个任务一个 results.csv，扫描时是大量的 inode 查找和逐行解析。
+# .ypack 把同类数据放进一个文件，读取时 np.memmap 映射，不解析也不拷贝:
+#   header   64 字节: magic, 版本, 每行宽度, 条目数, 行数, 字符串表字节数, meta 字节数
+#   rows     float32 [行数, 宽度]   标注: class_id x y w h (class_id 以 float32 存储，整数 < 2^24 精确)
+#   offsets  int64   [条目数 + 1]   第 i 个条目的行 = rows[offsets[i]:offsets[i + 1]]
+#   strings  int64   [条目数 + 1] + utf-8 字节   条目名 (标注: 图片名去掉扩展名)
+#   meta     JSON (标注: classes；指标: 列名和源 csv 的大小 / 修改时间)
+# 各段按 8 字节对齐。标注包和 YOLO txt 可以互相转换，txt 仍然是标注和训练使用的格式
+# 标注包只支持检测框 (每行 5 列)；分割多边形 / 姿态关键点的行宽不固定，打包时直接报错而不是截断
+
+MAGIC = b'YPACK\x00\x00\x00'
+VERSION = 1
+HEADER = struct.Struct('<8sIIQQQQ')  # magic, version, width, entries, rows, strings_bytes, meta_bytes
+HEADER_SIZE = 64
+
+def _align(n):
+    return (n + 7) & ~7
+
+def _layout(width, entries, rows, strings_bytes):
+    """ 各段在文件中的偏移 """
+    rows_at = HEADER_SIZE
+    offsets_at = _align(rows_at + rows * width * 4)
+    string_offsets_at = offsets_at + (entries + 1) * 8
+    strings_at = string_offsets_at + (entries + 1) * 8
+    meta_at = _align(strings_at + strings_bytes)
+    return rows_at, offsets_at, string_offsets_at, strings_at, meta_at
+
+def write_pack(path, width, items, meta=None):
+    """ items: [(名称, 形状为 (k, width) 的数组)]，先写临时文件再替换，读取方不会看到写了一半的文件 """
+    np = startup_service.lazy_import('numpy')
+    names = [n.encode('utf-8') for n, _ in items]
+    arrays = [np.asarray(a, dtype=np.float32).reshape(-1, width) for _, a in items]
+    counts = np.array([len(a) for a in arrays], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    string_offsets = np.concatenate([[0], np.cumsum([len(n) for n in names])]).astype(np.int64)
+    strings = b''.join(names)
+    meta_bytes = json.dumps(meta or {}, ensure_ascii=False).encode('utf-8')
+    rows = int(offsets[-1])
+    rows_at, offsets_at, string_offsets_at, strings_at, meta_at = _layout(width, len(items), rows, len(strings))
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, width, len(items), rows, len(strings), len(meta_bytes)).ljust(HEADER_SIZE, b'\0'))
+        for a in arrays:
+            f.write(a.tobytes())
+        f.write(b'\0' * (offsets_at - f.tell()))
+        f.write(offsets.tobytes())
+        f.write(string_offsets.tobytes())
+        f.write(strings)
+        f.write(b'\0' * (meta_at - f.tell()))
+        f.write(meta_bytes)
+    os.replace(tmp, path)
+    return path
+
+class Pack:
+    """ 只读的 .ypack，rows / offsets 是 np.memmap，名称和索引第一次用到时才解码 """
+    def __init__(self, path):
+        np = startup_service.lazy_import('numpy')
+        with open(path, 'rb') as f:
+            magic, version, width, entries, rows, strings_bytes, meta_bytes = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION: raise Exception(f"不是有效的 ypack 文件: {path}")
+            rows_at, offsets_at, string_offsets_at, strings_at, meta_at = _layout(width, entries, rows, strings_bytes)
+            f.seek(meta_at)
+            self.meta = json.loads(f.read(meta_bytes) or b'{}')
+        self.path = path
+        self.width = width
+        self.rows = (np.memmap(path, dtype=np.float32, mode='r', offset=rows_at, shape=(rows, width))
+                     if rows else np.zeros((0, width), dtype=np.float32))
+        self.offsets = np.memmap(path, dtype=np.int64, mode='r', offset=offsets_at, shape=(entries + 1,))
+        self._string_offsets = np.memmap(path, dtype=np.int64, mode='r', offset=string_offsets_at, shape=(entries + 1,))
+        self._strings = (np.memmap(path, dtype=np.uint8, mode='r', offset=strings_at, shape=(strings_bytes,))
+                         if strings_bytes else np.zeros(0, dtype=np.uint8))
+        self._names = None
+        self._index = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def name(self, i):
+        return bytes(self._strings[self._string_offsets[i]:self._string_offsets[i + 1]]).decode('utf-8')
+
+    @property
+    def names(self):
+        if self._names is None:
+            blob = bytes(self._strings).decode('utf-8')
+            # 字符串表按字节偏移，非 ASCII 名称需要按字节切片后再解码
+            if len(blob) == len(self._strings):
+                bounds = self._string_offsets.tolist()
+                self._names = [blob[bounds[i]:bounds[i + 1]] for i in range(len(self))]
+            else:
+                self._names = [self.name(i) for i in range(len(self))]
+        return self._names
+
+    def __contains__(self, name):
+        return self.find(name) is not None
+
+    def find(self, name):
+        if self._index is None:
+            self._index = {n: i for i, n in enumerate(self.names)}
+        return self._index.get(name)
+
+    def entry(self, i):
+        """ 第 i 个条目的所有行 (memmap 视图，不拷贝) """
+        return self.rows[self.offsets[i]:self.offsets[i + 1]]
+
+    def get(self, name):
+        i = self.find(name)
+        return None if i is None else self.entry(i)
+
+# ---------- 标注 (YOLO txt <-> .ypack) ----------
+def _parse_txt(path):
+    rows = []
+    with open(path, 'r') as f:
+        for no, line in enumerate(f, 1):
+            parts = line.split()
+            if not parts: continue
+            if len(parts) != 5:
+                raise Exception(f"{path}:{no} 有 {len(parts)} 列，标注包只支持检测框 (class x y w h)，"
+                                f"分割 / 关键点标注请直接使用 txt")
+            rows.append([float(v) for v in parts])
+    return rows
+
+@metrics_service.instrument('pack_labels')
+def pack_labels(labels_dir, out_path=None):
+    """ 把目录下所有 YOLO txt (不含 classes.txt) 打包为一个 .ypack，返回文件路径 """
+    out_path = out_path or os.path.join(labels_dir, 'labels.ypack')
+    items = []
+    with os.scandir(labels_dir) as it:
+        for e in sorted(it, key=lambda e: e.name):
+            if e.name.endswith('.txt') and e.name != 'classes.txt' and e.is_file():
+                items.append((e.name[:-4], _parse_txt(e.path)))
+    classes_path = os.path.join(labels_dir, 'classes.txt')
+    classes = []
+    if os.path.exists(classes_path):
+        with open(classes_path, 'r') as f:
+            classes = [line.strip() for line in f if line.strip()]
+    return write_pack(out_path, 5, items, {"kind": "labels", "classes": classes})
+
+def load_labels(pack_path):
+    pack = Pack(pack_path)
+    if pack.meta.get('kind') != 'labels': raise Exception(f"{pack_path} 不是标注包")
+    return pack
+
+def _format_row(row):
+    return f"{int(row[0])} {row[1]:.6f} {row[2]:.6f} {row[3]:.6f} {row[4]:.6f}\n"
+
+@metrics_service.instrument('unpack_labels')
+def unpack_labels(pack_path, labels_dir):
+    """ 还原为 YOLO txt (坐标保留 6 位小数)，返回写入的文件数 """
+    pack = load_labels(pack_path)
+    os.makedirs(labels_dir, exist_ok=True)
+    for i, name in enumerate(pack.names):
+        with open(os.path.join(labels_dir, name + '.txt'), 'w') as f:
+            f.write(''.join(_format_row(r) for r in pack.entry(i).tolist()))
+    if pack.meta.get('classes'):
+        with open(os.path.join(labels_dir, 'classes.txt'), 'w') as f:
+            f.write(''.join(f"{n}\n" for n in pack.meta['classes']))
+    return len(pack)
+
+# ---------- 训练指标 (results.csv -> results.ypack) ----------
+def _csv_signature(csv_path):
+    st = os.stat(csv_path)
+    return [st.st_size, st.st_mtime_ns]
+
+def read_metrics(csv_path):
+    """
+    读取 results.csv，返回 {列名: 数组}；列名已去掉空格
+    旁边的 results.ypack 与 csv 的大小 / 修改时间一致时直接映射，否则先从 csv 重建 (训练中每个 epoch 重建一次)
+    """
+    np = startup_service.lazy_import('numpy')
+    pack_path = os.path.splitext(csv_path)[0] + '.ypack'
+    signature = _csv_signature(csv_path)
+    pack = None
+    if os.path.exists(pack_path):
+        try:
+            pack = Pack(pack_path)
+            if pack.meta.get('source') != signature: pack = None
+        except Exception:
+            pack = None
+    if pack is None:
+        with metrics_service.track('csv_parse'):
+            with open(csv_path, 'r', newline='') as f:
+                reader = csv.reader(f)
+                columns = [c.strip() for c in next(reader, [])]
+                rows = [[float(v) if v.strip() else float('nan') for v in row] for row in reader if row]
+        table = np.array(rows, dtype=np.float32).reshape(-1, len(columns))
+        metrics_service.inc('yolo_packed_metrics_rebuilds_total')
+        try:
+            write_pack(pack_path, len(columns), [('results', table)],
+                       {"kind": "metrics", "columns": columns, "source": signature})
+        except OSError:
+            pass  # 目录只读时直接返回解析结果
+        return _columns(np, table, columns)
+    table = pack.entry(0)
+    return _columns(np, table, pack.meta['columns'])
+
+def _columns(np, table, columns):
+    # 指标表很小 (epoch 数 × 十几列)，转回 float64 并按 csv 的精度取整，避免 float32 的尾数出现在接口里
+    table = np.round(table.astype(np.float64), 6)
+    return {c: table[:, i] for i, c in enumerate(columns)}
+
+def load_results(csv_path):
+    """ 读取 results.csv 为 {列名: 数组}: PACKED_METRICS=True 时使用 .ypack，否则用 pandas 解析 """
+    if Config.PACKED_METRICS: return read_metrics(csv_path)
+    pd = startup_service.lazy_import('pandas')
+    with metrics_service.track('csv_parse'):
+        df = pd.read_csv(csv_path)
+    df.columns = [c.strip() for c in df.columns]
+    return {c: df[c].to_numpy() for c in df.columns}
+
+# ---------- 基准测试 ----------
+def _synthetic_labels(folder, n_images, boxes_per_image=8, seed=0):
+    np = startup_service.lazy_import('numpy')
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+    for i in range(n_images):
+        k = int(rng.integers(0, boxes_per_image * 2))
+        with open(os.path.join(folder, f"img_{i:07d}.txt"), 'w') as f:
+            f.write(''.join(f"{int(rng.integers(0, 80))} {rng.random():.6f} {rng.random():.6f} "
+                            f"{rng.random():.6f} {rng.random():.6f}\n" for _ in range(k)))
+
+def benchmark(labels_dir=None, n_images=20000, repeat=3):
+    """
+    对比三种读取方式的耗时 (秒，取 repeat 次最快):
+      txt:      逐个打开并解析 txt (当前方式)
+      pack:     映射 .ypack 并把每个条目的行读出来 (np.array 拷贝，确实发生磁盘 / 页缓存读取)
+      pack_one: 映射 .ypack 后按名称查一张图片并读出 (打开数据集后随机访问的代价)
+    labels_dir 为空时生成 n_images 张合成标注
+    """
+    work = tempfile.mkdtemp(prefix='ypack_bench_')
+    try:
+        return _benchmark(labels_dir, n_images, repeat, work)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+def _benchmark(labels_dir, n_images, repeat, work):
+    if not labels_dir:
+        labels_dir = os.path.join(work, 'labels')
+        _synthetic_labels(labels_dir, n_images)
+    pack_path = os.path.join(work, 'labels.ypack')
+
+    start = time.perf_counter()
+    pack_labels(labels_dir, pack_path)
+    pack_seconds = time.perf_counter() - start
+
+    def load_txt():
+        with os.scandir(labels_dir) as it:
+            return {e.name[:-4]: _parse_txt(e.path) for e in it if e.name.endswith('.txt') and e.name != 'classes.txt'}
+
+    np = startup_service.lazy_import('numpy')
+
+    def load_pack():
+        # 只建 memmap 视图不会读取任何数据，这里逐条拷贝出来，和 txt 解析的工作量对等
+        pack = Pack(pack_path)
+        return {name: np.array(pack.entry(i)) for i, name in enumerate(pack.names)}
+
+    def load_one():
+        pack = Pack(pack_path)
+        return np.array(pack.get(pack.name(len(pack) // 2))) if len(pack) else None
+
+    def best(fn):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    txt_seconds, pack_seconds_load, one_seconds = best(load_txt), best(load_pack), best(load_one)
+    pack = Pack(pack_path)
+    return {
+        "images": len(pack),
+        "boxes": int(pack.offsets[-1]) if len(pack) else 0,
+        "txt_seconds": round(txt_seconds, 4),
+        "pack_seconds": round(pack_seconds_load, 4),
+        "pack_one_seconds": round(one_seconds, 5),
+        "speedup": round(txt_seconds / max(pack_seconds_load, 1e-9), 1),
+        "convert_seconds": round(pack_seconds, 4),
+        "pack_mb": round(os.path.getsize(pack_path) / 1024 / 1024, 2)
+    }
+
+if __name__ == '__main__':
+    # python -m services.packed_service pack <labels_dir> [out.ypack]
+    # python -m services.packed_service unpack <labels.ypack> <labels_dir>
+    # python -m services.packed_service bench [labels_dir | 图片数]
+    if len(sys.argv) < 2 or sys.argv[1] not in ('pack', 'unpack', 'bench'):
+        print("用法: pack <labels_dir> [out.ypack] | unpack <labels.ypack> <labels_dir> | bench [labels_dir | 图片数]")
+        sys.exit(1)
+    cmd, args = sys.argv[1], sys.argv[2:]
+    if cmd == 'pack':
+        print(f"✅ 已打包: {pack_labels(args[0], args[1] if len(args) > 1 else None)}")
+    elif cmd == 'unpack':
+        print(f"✅ 已还原 {unpack_labels(args[0], args[1])} 个标注文件")
+    else:
+        arg = args[0] if args else ''
+        if not arg: result = benchmark()
+        elif arg.isdigit(): result = benchmark(n_images=int(arg))
+        else: result = benchmark(labels_dir=arg)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
@@ -0,0 +1,199 @@
+import os
+import time
+import shutil
+import threading
+from config import Config
+from services import metrics_service, dashboard_service, stream_service, packed_service, labeling_service
+from services.training_service import state
+
+# ================= 磁盘保留策略 =================
+# 按目录 (uploads / results / runs / datasets) 分别应用策略，大小统计与仪表盘的磁盘占用一致 (dashboard_service.scan_usage)
+#   max_age_days: 超过天数未修改的条目 -> 删除 (runs 为精简，只保留 best.pt)
+#   max_mb:       目录总大小超限时，从最旧的条目开始处理直到低于上限 (runs 先精简，仍超限再整个删除)
+#   keep_top_k:   runs 中 mAP50-95 最高的 K 个任务永远不动
+# datasets 下只处理导出 / 解压出来的训练数据集，标注工作区 (raw_images、labels 及其编辑日志) 永远不动
+# 先生成计划 (dry-run 报告)，执行时按同一份计划删除
+
+GRACE_SECONDS = 3600               # 最近 1 小时内修改过的条目可能仍在使用，不处理
+PRUNE_KEEP = ('weights/best.pt', 'results.csv')  # 精简后保留的文件 (results.csv 很小，排名和历史记录依赖它)
+MAP_COL = 'metrics/mAP50-95(B)'
+
+_run_lock = threading.Lock()
+_last_report = None
+
+def _run_map(run_path):
+    csv_path = os.path.join(run_path, 'results.csv')
+    if not os.path.exists(csv_path): return 0.0
+    try:
+        return float(packed_service.load_results(csv_path)[MAP_COL].max())
+    except Exception:
+        return 0.0
+
+def _workspace_dirs():
+    """ 标注工作区: 原始图片、所有标注 txt 和 .history 编辑日志都在这里，不属于可清理的数据集 """
+    return [os.path.realpath(p) for p in (labeling_service.RAW_IMAGES_DIR, labeling_service.LABELS_OUTPUT_DIR)]
+
+def _touches_workspace(path):
+    """ path 就是工作区、包含工作区或位于工作区之内 """
+    path = os.path.realpath(path)
+    for ws in _workspace_dirs():
+        if path == ws or ws.startswith(path + os.sep) or path.startswith(ws + os.sep): return True
+    return False
+
+def _prunable_bytes(run_path):
+    """ 精简能释放的字节数 (总大小 - 保留文件) """
+    total = dashboard_service.scan_usage(run_path)[0]
+    kept = sum(dashboard_service.scan_usage(os.path.join(run_path, k))[0] for k in PRUNE_KEEP)
+    return total - kept
+
+def _entries(folder):
+    entries = []
+    if not os.path.exists(folder): return entries
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        size, mtime = dashboard_service.scan_usage(path)
+        entries.append({"name": name, "path": path, "bytes": size, "mtime": mtime})
+    return sorted(entries, key=lambda e: e['mtime'])  # 最旧的在前
+
+def _protected(key):
+    """ 正在使用中的条目: 训练进行中时不动 runs / datasets，正在回放的视频不删 """
+    if key in ('runs', 'datasets') and state.is_training: return None  # None 表示整个目录跳过
+    if key == 'uploads':
+        return {os.path.basename(s['source']) for s in stream_service.get_streams()}
+    return set()
+
+def _plan_folder(key, folder, policy, now):
+    entries = _entries(folder)
+    # 标注工作区既不参与清理，也不计入容量上限 (否则工作区本身超限时会把所有数据集删光)
+    workspace = [e for e in entries if _touches_workspace(e['path'])]
+    entries = [e for e in entries if e not in workspace]
+    size = sum(e['bytes'] for e in entries)
+    limit = policy.get('max_mb', 0) * 1024 * 1024
+    report = {"folder": key, "size_mb": round(size / 1024 / 1024, 1),
+              "limit_mb": policy.get('max_mb', 0), "skipped": None, "actions": [],
+              "excluded": [e['name'] for e in workspace],
+              "excluded_mb": round(sum(e['bytes'] for e in workspace) / 1024 / 1024, 1)}
+
+    protected = _protected(key)
+    if protected is None:
+        report['skipped'] = "训练进行中"
+        report['after_mb'] = report['size_mb']
+        return report
+
+    candidates = [e for e in entries if e['name'] not in protected and now - e['mtime'] > GRACE_SECONDS]
+    if key == 'runs':
+        for e in entries:
+            e['map'] = _run_map(e['path'])
+        keep_k = policy.get('keep_top_k', 0)
+        top = {e['name'] for e in sorted(entries, key=lambda e: e['map'], reverse=True)[:keep_k]}
+        candidates = [e for e in candidates if e['name'] not in top and os.path.isdir(e['path'])]
+        for e in candidates:
+            e['prunable'] = _prunable_bytes(e['path'])
+
+    actions, handled = [], set()
+    def add(entry, action, reason):
+        freed = entry['prunable'] if action == 'prune' else entry['bytes']
+        actions.append({"name": entry['name'], "path": entry['path'], "action": action,
+                        "reason": reason, "bytes": freed, "map50_95": entry.get('map')})
+        entry['bytes'] -= freed
+        handled.add((entry['name'], action))
+        return freed
+
+    # 1. 按时间
+    max_age = policy.get('max_age_days', 0) * 86400
+    if max_age:
+        for e in candidates:
+            if now - e['mtime'] <= max_age: continue
+            if key != 'runs': add(e, 'delete', 'age')
+            elif e['prunable'] > 0: add(e, 'prune', 'age')
+
+    # 2. 按目录总大小，从最旧的开始
+    remaining = size - sum(a['bytes'] for a in actions)
+    if limit and remaining > limit:
+        if key == 'runs':
+            for e in candidates:
+                if remaining <= limit: break
+                if e['prunable'] > 0 and (e['name'], 'prune') not in handled:
+                    remaining -= add(e, 'prune', 'size')
+        for e in candidates:
+            if remaining <= limit: break
+            if (e['name'], 'delete') in handled or e['bytes'] <= 0: continue
+            remaining -= add(e, 'delete', 'size')
+
+    report['actions'] = actions
+    report['reclaim_mb'] = round(sum(a['bytes'] for a in actions) / 1024 / 1024, 1)
+    report['after_mb'] = round((size - sum(a['bytes'] for a in actions)) / 1024 / 1024, 1)
+    return report
+
+def _merge_policy(overrides):
+    policy = {k: dict(v) for k, v in Config.RETENTION_POLICY.items()}
+    for key, values in (overrides or {}).items():
+        if key not in policy: raise Exception(f"未知目录: {key}")
+        policy[key].update({k: float(v) for k, v in values.items()})
+    if 'keep_top_k' in policy['runs']: policy['runs']['keep_top_k'] = int(policy['runs']['keep_top_k'])
+    return policy
+
+def _prune_run(run_path):
+    """ 只保留 PRUNE_KEEP 中的文件 """
+    keep = {os.path.normpath(os.path.join(run_path, k)) for k in PRUNE_KEEP}
+    for dirpath, dirnames, filenames in os.walk(run_path, topdown=False):
+        for f in filenames:
+            fp = os.path.join(dirpath, f)
+            if os.path.normpath(fp) not in keep: os.remove(fp)
+        if dirpath != run_path and not os.listdir(dirpath): os.rmdir(dirpath)
+
+def _execute(action):
+    path = action['path']
+    if _touches_workspace(path): raise Exception(f"拒绝删除标注工作区: {path}")
+    if action['action'] == 'prune': _prune_run(path)
+    elif os.path.isdir(path) and not os.path.islink(path): shutil.rmtree(path)
+    elif os.path.lexists(path): os.remove(path)
+
+@metrics_service.instrument('retention')
+def run_retention(dry_run=True, policy=None):
+    """
+    生成 (并在 dry_run=False 时执行) 清理计划
+    返回报告: 每个目录的当前大小 / 上限 / 处理后大小，以及每个条目的动作、原因和可释放空间
+    """
+    global _last_report
+    policy = _merge_policy(policy)
+    with _run_lock:
+        now = time.time()
+        folders = [_plan_folder(key, dashboard_service.DISK_FOLDERS[key], policy[key], now)
+                   for key in dashboard_service.DISK_FOLDERS]
+        report = {
+            "dry_run": dry_run,
+            "time": now,
+            "policy": policy,
+            "folders": folders,
+            "reclaim_mb": round(sum(f.get('reclaim_mb', 0) for f in folders), 1)
+        }
+        if not dry_run:
+            for f in folders:
+                for action in f['actions']:
+                    try:
+                        _execute(action)
+                        metrics_service.inc('yolo_retention_reclaimed_bytes_total', action['bytes'], folder=f['folder'])
+                    except Exception as e:
+                        action['error'] = str(e)
+                        print(f"⚠️ 清理失败 {action['path']}: {e}")
+            _last_report = report
+            print(f"🧹 保留策略执行完成，释放 {report['reclaim_mb']} MB")
+        return report
+
+def get_last_report():
+    return _last_report
+
+def start_scheduler():
+    """ 后台定时执行保留策略 """
+    def _loop():
+        while True:
+            try:
+                run_retention(dry_run=False)
+            except Exception as e:
+                print(f"⚠️ 保留策略执行失败: {e}")
+            time.sleep(Config.RETENTION_INTERVAL_MIN * 60)
+
+    thread = threading.Thread(target=_loop)
+    thread.daemon = True
+    thread.start()
@@ -0,0 +1,66 @@
+import sys
+import time
+import importlib
+import threading
+from contextlib import contextmanager
+
+# 启动耗时记录: 每项 {name, kind, seconds, at}
+#   kind = 'import'  模块导入 (包括延迟到首次使用时的重依赖)
+#   kind = 'init'    初始化步骤 (建目录、注册蓝图、模型预热...)
+_records = []
+_lock = threading.Lock()
+_process_start = time.perf_counter()
+
+def record(name, seconds, kind='import'):
+    with _lock:
+        _records.append({
+            "name": name,
+            "kind": kind,
+            "seconds": round(seconds, 4),
+            "at": round(time.perf_counter() - _process_start, 4)  # 相对进程启动的时间点
+        })
+
+_local = threading.local()  # 每个线程当前嵌套的 timed 块 (用于扣除内层耗时)
+
+@contextmanager
+def timed(name, kind='import'):
+    """
+    统计一段代码耗时: with timed('routes.inference_routes'): ...
+    只记录自身耗时: 嵌套的 timed 块 (例如导入过程中的 lazy_import) 单独记录，并从外层扣除，合计不会重复
+    kind='import' 且模块已被之前的块间接导入时不再记录 (否则会出现一条 ~0s 的记录)
+    """
+    if kind == 'import' and name in sys.modules:
+        yield
+        return
+    stack = _local.__dict__.setdefault('stack', [])
+    frame = {"children": 0.0}
+    stack.append(frame)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        if stack: stack[-1]["children"] += elapsed
+        record(name, elapsed - frame["children"], kind)
+
+def lazy_import(module_name):
+    """
+    延迟导入重依赖 (cv2 / ultralytics / pandas / pynvml ...)
+    只有第一次真正导入时才计时，之后直接走 sys.modules 缓存
+    """
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    with timed(module_name, 'import'):
+        return importlib.import_module(module_name)
+
+def get_startup_report():
+    """ 返回启动耗时报告，按耗时从高到低排序 """
+    with _lock:
+        items = sorted(_records, key=lambda r: r['seconds'], reverse=True)
+    return {
+        "total_import": round(sum(r['seconds'] for r in items if r['kind'] == 'import'), 4),
+        "total_init": round(sum(r['seconds'] for r in items if r['kind'] == 'init'), 4),
+        "items": items
+    }
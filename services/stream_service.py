@@ -0,0 +1,235 @@
+import os
+import time
+import uuid
+import threading
+from config import Config
+from services import startup_service, metrics_service, inference_service
+
+# ================= 实时流推理 =================
+# 采集线程: 不停读取最新帧，只保留一帧 (新帧覆盖旧帧)，推理跟不上时直接丢弃过期帧而不是排队
+# 推理线程: 取最新帧 -> annotate_frame -> 编码 JPEG，发布给所有 MJPEG 观看者
+# 本地视频文件按原始帧率回放，模拟实时摄像头 (用于测试)
+
+STREAM_IDLE_TIMEOUT = 60  # 没有观看者超过 60s 自动停止
+STOPPED_STREAM_TTL = 300  # 已停止的流保留 5 分钟，前端仍能通过 stats 看到错误原因
+
+class Stream:
+    def __init__(self, source, model_path, conf_thres=0.25, imgsz=640):
+        self.id = uuid.uuid4().hex[:8]
+        self.source = source
+        self.model_path = model_path
+        self.conf_thres = conf_thres
+        self.imgsz = imgsz
+
+        self.running = False
+        self.error = None
+        self.started = time.time()
+        self.stopped = None
+        self.last_viewed = time.time()
+
+        # 单槽 "最新帧" (frame, 采集时间, 序号)
+        self._slot = None
+        self._slot_lock = threading.Lock()
+        self._slot_ready = threading.Event()
+
+        # 最新的标注结果 (JPEG bytes)，观看者等待 _output_cond
+        self._output = None
+        self._output_seq = 0
+        self._output_cond = threading.Condition()
+
+        self.stats = {"captured": 0, "inferred": 0, "dropped": 0,
+                      "latency_ms": 0.0, "latency_avg_ms": 0.0, "fps": 0.0}
+
+    # ---------- 生命周期 ----------
+    def start(self):
+        # 每个流使用独立的模型实例: Ultralytics 的 predictor 不是线程安全的，不能和 /upload 共用同一个对象
+        YOLO = startup_service.lazy_import('ultralytics').YOLO
+        with metrics_service.track('model_load'):
+            self.model = YOLO(self.model_path)
+        with _lock:
+            self.running = True
+            metrics_service.gauge_add('yolo_streams_active', 1)
+        for target in (self._capture_loop, self._inference_loop):
+            t = threading.Thread(target=target)
+            t.daemon = True
+            t.start()
+        return self
+
+    def stop(self):
+        """ 可重复调用: 采集线程、推理线程和 stop_stream 可能同时停止同一个流，只有第一次生效 """
+        with _lock:
+            if not self.running: return
+            self.running = False
+            self.stopped = time.time()
+            metrics_service.gauge_add('yolo_streams_active', -1)
+        self._slot_ready.set()
+        with self._output_cond:
+            self._output_cond.notify_all()
+
+    # ---------- 采集 ----------
+    def _open(self):
+        cv2 = startup_service.lazy_import('cv2')
+        source = int(self.source) if str(self.source).isdigit() else self.source
+        cap = cv2.VideoCapture(source)
+        if not cap.isOpened(): raise Exception(f"无法打开视频源: {self.source}")
+        # 网络流/摄像头尽量只缓冲 1 帧，减少驱动层面的排队延迟
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    def _capture_loop(self):
+        cv2 = startup_service.lazy_import('cv2')
+        is_file = os.path.isfile(str(self.source))
+        try:
+            cap = self._open()
+            fps = cap.get(cv2.CAP_PROP_FPS) or 25
+            interval = 1.0 / fps
+            next_time = time.perf_counter()
+            seq = 0
+            rewound = False
+            while self.running:
+                ret, frame = cap.read()
+                if not ret:
+                    if is_file and not rewound:
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)  # 文件回放到结尾后循环
+                        rewound = True
+                        continue
+                    # 回到开头仍读不到帧 (空文件 / 无法解码)，不能无限重试
+                    raise Exception("视频文件读取不到任何帧" if is_file else "视频流已断开")
+                rewound = False
+                seq += 1
+                self.stats["captured"] += 1
+                with self._slot_lock:
+                    if self._slot is not None:
+                        # 上一帧还没被推理线程取走，直接丢弃
+                        self.stats["dropped"] += 1
+                        metrics_service.inc('yolo_stream_frames_dropped_total')
+                    self._slot = (frame, time.perf_counter(), seq)
+                self._slot_ready.set()
+
+                if is_file:
+                    # 按原始帧率回放
+                    next_time += interval
+                    delay = next_time - time.perf_counter()
+                    if delay > 0: time.sleep(delay)
+                    else: next_time = time.perf_counter()
+            cap.release()
+        except Exception as e:
+            self.error = str(e)
+            print(f"❌ 流 {self.id} 采集失败: {e}")
+            self.stop()
+
+    # ---------- 推理 ----------
+    def _inference_loop(self):
+        cv2 = startup_service.lazy_import('cv2')
+        fps_window = []
+        while self.running:
+            if not self._slot_ready.wait(timeout=1.0): continue
+            with self._slot_lock:
+                item, self._slot = self._slot, None
+                self._slot_ready.clear()
+            if item is None: continue
+            frame, captured_at, seq = item
+
+            try:
+                annotated, _ = inference_service.annotate_frame(self.model, frame, self.conf_thres, self.imgsz)
+                ok, jpeg = cv2.imencode('.jpg', annotated, [cv2.IMWRITE_JPEG_QUALITY, 80])
+            except Exception as e:
+                self.error = str(e)
+                print(f"❌ 流 {self.id} 推理失败: {e}")
+                self.stop()
+                break
+            if not ok: continue
+
+            # 端到端延迟: 帧被采集 -> 标注结果可供发送
+            now = time.perf_counter()
+            latency = now - captured_at
+            metrics_service.observe('yolo_stage_duration_seconds', latency, stage='stream_e2e')
+            n = self.stats["inferred"] = self.stats["inferred"] + 1
+            self.stats["latency_ms"] = round(latency * 1000, 1)
+            self.stats["latency_avg_ms"] = round(self.stats["latency_avg_ms"] + (latency * 1000 - self.stats["latency_avg_ms"]) / n, 1)
+            fps_window = [t for t in fps_window if now - t < 2.0] + [now]
+            self.stats["fps"] = round(len(fps_window) / 2.0, 1)
+
+            with self._output_cond:
+                self._output = jpeg.tobytes()
+                self._output_seq = seq
+                self._output_cond.notify_all()
+
+            if time.time() - self.last_viewed > STREAM_IDLE_TIMEOUT:
+                print(f"⏹️ 流 {self.id} 长时间无人观看，自动停止")
+                self.stop()
+
+    # ---------- 输出 ----------
+    def mjpeg_frames(self):
+        """ MJPEG 生成器: 每次只发送最新的一帧，慢客户端同样会跳帧而不是积压 """
+        last_seq = 0  # 0 表示还没有任何输出
+        while self.running:
+            with self._output_cond:
+                self._output_cond.wait_for(lambda: not self.running or self._output_seq != last_seq, timeout=5.0)
+                if not self.running: break
+                if self._output_seq == last_seq: continue
+                data, last_seq = self._output, self._output_seq
+            self.last_viewed = time.time()
+            yield (b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: " +
+                   str(len(data)).encode() + b"\r\n\r\n" + data + b"\r\n")
+
+    def info(self):
+        return {
+            "id": self.id, "source": str(self.source), "model": self.model_path,
+            "conf": self.conf_thres, "imgsz": self.imgsz,
+            "running": self.running, "error": self.error,
+            "uptime": round((self.stopped or time.time()) - self.started, 1),
+            **self.stats
+        }
+
+_streams = {}
+_starting = 0            # 已占用名额但模型还在加载中的流
+_lock = threading.Lock()  # 保护 _streams / _starting 以及每个流的 running 状态
+
+def resolve_source(source):
+    """ 允许: 摄像头编号、rtsp/http(s) 地址、uploads 目录中已上传的视频文件名 """
+    source = str(source).strip()
+    if source.isdigit() or source.startswith(('rtsp://', 'rtmp://', 'http://', 'https://')):
+        return source
+    path = os.path.join(Config.UPLOAD_FOLDER, os.path.basename(source))
+    if os.path.isfile(path): return path
+    raise Exception(f"不支持的视频源: {source}")
+
+def start_stream(source, model_path, conf_thres=0.25, imgsz=640):
+    global _starting
+    source = resolve_source(source)
+    # 检查名额和占用名额在同一次加锁内完成，并发启动不会超过 MAX_STREAMS；模型加载较慢，放在锁外
+    with _lock:
+        running = sum(1 for s in _streams.values() if s.running)
+        if running + _starting >= Config.MAX_STREAMS: raise Exception(f"最多同时运行 {Config.MAX_STREAMS} 路流")
+        _starting += 1
+    stream = None
+    try:
+        stream = Stream(source, model_path, conf_thres, imgsz).start()
+        return stream
+    finally:
+        with _lock:
+            _starting -= 1
+            # 释放预留名额和登记在同一次加锁内；启动后立即失败的流 (打不开视频源) 同样登记，
+            # 它已经不是 running，不占名额，前端仍能通过 stats 拿到错误原因
+            if stream is not None: _streams[stream.id] = stream
+
+def get_stream(stream_id):
+    with _lock:
+        return _streams.get(stream_id)
+
+def stop_stream(stream_id):
+    with _lock:
+        stream = _streams.get(stream_id)
+    if stream:
+        stream.stop()
+        return True
+    return False
+
+def get_streams():
+    with _lock:
+        # 顺便清理停止超过 STOPPED_STREAM_TTL 的流 (刚停止的保留，错误信息还要展示)
+        now = time.time()
+        for sid in [sid for sid, s in _streams.items() if not s.running and now - s.stopped > STOPPED_STREAM_TTL]:
+            del _streams[sid]
+        return [s.info() for s in _streams.values()]
@@ -0,0 +1,276 @@
+import os
+import json
+import math
+import time
+import random
+import itertools
+import threading
+from werkzeug.utils import secure_filename
+from config import Config
+from services import training_service, upload_service, packed_service
+from services.training_service import state
+
+# ================= 超参数搜索 (Sweep) =================
+# 所有 trial 共用一次解压好的数据集，按顺序逐个启动 yolo train (共用 training_service 的日志/终止逻辑)
+# 搜索策略:
+#   grid    网格搜索，space 中每个参数给出候选列表
+#   random  随机搜索，参数可以是候选列表，或 {"min": a, "max": b, "log": false, "int": false} 连续区间
+#   halving 随机采样 + 异步逐次减半 (ASHA): 到达每个 rung 时只保留前 1/eta 的 trial
+# grid / random 开启 early_stop 时使用中位数规则: 到达 rung 时低于已完成 trial 中位数的直接终止
+
+STRATEGIES = ('grid', 'random', 'halving')
+SEARCHABLE_PARAMS = training_service.AUG_PARAMS + training_service.SYS_PARAMS
+
+MAP50_COL = 'metrics/mAP50(B)'
+MAP_COL = 'metrics/mAP50-95(B)'
+
+_lock = threading.Lock()
+
+def _sweep_path(sweep_name):
+    # sweep 名同时是 json 文件名和 trial 训练目录的前缀，只允许 secure_filename 之后不变的名字
+    if not sweep_name or secure_filename(sweep_name) != sweep_name:
+        raise Exception(f"非法的 Sweep 名称: {sweep_name}")
+    return os.path.join(Config.SWEEP_FOLDER, f"{sweep_name}.json")
+
+def _save(record):
+    with _lock:
+        os.makedirs(Config.SWEEP_FOLDER, exist_ok=True)
+        path = _sweep_path(record['name'])
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+        os.replace(path + '.tmp', path)
+
+def generate_trials(strategy, space, n_trials=10, seed=None):
+    """ 根据搜索空间生成每个 trial 的参数组合 """
+    for key in space:
+        if key not in SEARCHABLE_PARAMS: raise Exception(f"不支持搜索的参数: {key}")
+
+    if strategy == 'grid':
+        keys = list(space.keys())
+        for key in keys:
+            if not isinstance(space[key], list): raise Exception(f"网格搜索的参数 {key} 必须是候选列表")
+        return [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+
+    rng = random.Random(seed)
+    trials = []
+    for _ in range(int(n_trials)):
+        params = {}
+        for key, spec in space.items():
+            if isinstance(spec, list):
+                params[key] = rng.choice(spec)
+            elif spec.get('log'):
+                params[key] = math.exp(rng.uniform(math.log(spec['min']), math.log(spec['max'])))
+            else:
+                params[key] = rng.uniform(spec['min'], spec['max'])
+            if isinstance(spec, dict):
+                params[key] = int(round(params[key])) if spec.get('int') else round(params[key], 6)
+        trials.append(params)
+    return trials
+
+def make_rungs(epochs, min_epochs, eta):
+    """ rung 检查点: min_epochs, min_epochs*eta, ... (小于总 epochs) """
+    rungs = []
+    r = max(1, int(min_epochs))
+    while r < int(epochs):
+        rungs.append(r)
+        r *= int(eta)
+    return rungs
+
+def _read_curve(project_name):
+    """ 读取 results.csv 的 mAP 曲线: [(epoch_done, map50, map50_95), ...] """
+    csv_path = os.path.join(Config.RUNS_FOLDER, project_name, 'results.csv')
+    if not os.path.exists(csv_path): return []
+    try:
+        results = packed_service.load_results(csv_path)
+        return [(i + 1, m50, m) for i, (m50, m) in
+                enumerate(zip(results[MAP50_COL].tolist(), results[MAP_COL].tolist()))]
+    except Exception:
+        return []
+
+def _should_prune(record, trial, curve):
+    """ 到达新 rung 时记录该 trial 的成绩，并与之前 trial 在同一 rung 的成绩比较 """
+    if not (record['early_stop'] or record['strategy'] == 'halving'): return None
+    epochs_done = len(curve)
+    for rung in record['rungs']:
+        key = str(rung)
+        if epochs_done < rung or key in trial['rung_maps']: continue
+        value = max(c[2] for c in curve[:rung])
+        trial['rung_maps'][key] = value
+
+        peers = sorted((t['rung_maps'][key] for t in record['trials']
+                        if t is not trial and key in t['rung_maps']), reverse=True)
+        if record['strategy'] == 'halving':
+            # ASHA: 至少 eta-1 个对手才做决定，只保留前 1/eta
+            if len(peers) < record['eta'] - 1: continue
+            values = sorted(peers + [value], reverse=True)
+            cutoff = values[max(1, len(values) // record['eta']) - 1]
+            if value < cutoff:
+                return f"rung {rung} mAP50-95={value:.4f} 未进入前 1/{record['eta']} (门槛 {cutoff:.4f})"
+        else:
+            # 中位数规则: 至少 2 个对手
+            if len(peers) < 2: continue
+            median = peers[len(peers) // 2]
+            if value < median:
+                return f"rung {rung} mAP50-95={value:.4f} 低于中位数 {median:.4f}"
+    return None
+
+def _summarize(record, trial, curve):
+    # 监控是定时轮询的，补齐可能错过的 rung 成绩，供后续 trial 比较
+    for rung in record['rungs']:
+        if len(curve) >= rung and str(rung) not in trial['rung_maps']:
+            trial['rung_maps'][str(rung)] = max(c[2] for c in curve[:rung])
+    if curve:
+        trial['epochs_done'] = len(curve)
+        trial['best_map50'] = round(max(c[1] for c in curve), 5)
+        trial['best_map50_95'] = round(max(c[2] for c in curve), 5)
+    # 性价比: 每小时训练时间带来的 mAP50-95
+    hours = trial['seconds'] / 3600
+    trial['score'] = round(trial['best_map50_95'] / hours, 5) if hours > 0 else 0
+
+def get_leaderboard(record):
+    """
+    只有正常跑完的 trial (status == 'ok') 参与排名，按 mAP50-95 / 训练小时 排序 (同分看绝对精度)
+    被剪枝的 trial 训练时间很短，直接除以小时数会排到最前面，单独放在 get_pruned() 里
+    """
+    completed = [t for t in record['trials'] if t['status'] == 'ok']
+    return sorted(completed, key=lambda t: (t['score'], t['best_map50_95']), reverse=True)
+
+def get_pruned(record):
+    """ 被提前终止的 trial，按最后到达的 rung 和该 rung 的成绩排序 """
+    def reached(t):
+        rungs = [int(r) for r in t['rung_maps']]
+        return (max(rungs), t['rung_maps'][str(max(rungs))]) if rungs else (0, 0.0)
+    pruned = [t for t in record['trials'] if t['status'] == 'pruned']
+    return sorted(pruned, key=reached, reverse=True)
+
+def _run_sweep_thread(record, zip_path, dataset_name):
+    state.stop_event = False
+    try:
+        # 1. 数据集只准备一次，所有 trial 共用
+        yaml_path = training_service.prepare_dataset(zip_path, dataset_name)
+        base = record['base']
+        yaml_path, base['extra_args'] = training_service.prepare_dataset_cache(yaml_path, base['imgsz'], base['extra_args'])
+        record['yaml_path'] = yaml_path
+        _save(record)
+
+        for trial in record['trials']:
+            if state.stop_event: break
+            state.logs.append(f"\n🧪 Trial {trial['id']}/{len(record['trials'])}: {trial['params']}\n")
+            trial['status'] = 'running'
+            _save(record)
+
+            extra_args = {**base['extra_args'], **trial['params']}
+            cmd = training_service.build_train_cmd(
+                yaml_path, base['model_name'], base['epochs'], base['batch'], base['imgsz'],
+                trial['project'], extra_args
+            )
+
+            def monitor():
+                return _should_prune(record, trial, _read_curve(trial['project']))
+
+            start = time.time()
+            trial['status'] = training_service.run_yolo_process(cmd, monitor=monitor)
+            trial['seconds'] = round(time.time() - start, 1)
+            _summarize(record, trial, _read_curve(trial['project']))
+            state.logs.append(f"📊 Trial {trial['id']} mAP50-95={trial['best_map50_95']} 用时 {trial['seconds']}s\n")
+            _save(record)
+
+        record['status'] = 'stopped' if state.stop_event else 'completed'
+        board = get_leaderboard(record)
+        if board:
+            best = board[0]
+            state.logs.append(f"\n🏆 Sweep 完成，性价比最高: {best['project']} {best['params']} (mAP50-95={best['best_map50_95']})\n")
+        else:
+            state.logs.append("\n⚠️ 没有跑完的 trial，无法给出推荐 (被剪枝的 trial 不参与排名)\n")
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = str(e)
+        state.logs.append(f"\n❌ Sweep 错误: {str(e)}\n")
+    finally:
+        record['finished'] = time.time()
+        _save(record)
+        state.is_training = False
+        state.process = None
+
+def start_sweep(file, sweep_name, model_name, epochs, batch, imgsz, space, strategy='random',
+                n_trials=10, eta=3, min_epochs=5, early_stop=True, extra_args=None, seed=None, upload_id=None):
+    if state.is_training: raise Exception("已有任务在运行")
+    sweep_name = secure_filename(sweep_name or '')
+    if not sweep_name: raise Exception("Sweep 名称不能为空")
+    if strategy not in STRATEGIES: raise Exception(f"未知搜索策略: {strategy}")
+    if not space: raise Exception("搜索空间不能为空")
+
+    params_list = generate_trials(strategy, space, n_trials, seed)
+    if not params_list: raise Exception("搜索空间没有生成任何 trial")
+
+    # 同名 sweep 的 trial 目录会被 yolo 复用，_read_curve 会读到上一次残留的 results.csv
+    projects = [f"{sweep_name}_t{i + 1:02d}" for i in range(len(params_list))]
+    if os.path.exists(_sweep_path(sweep_name)) or \
+            any(os.path.exists(os.path.join(Config.RUNS_FOLDER, p)) for p in projects):
+        raise Exception(f"Sweep 名称已存在: {sweep_name}")
+
+    zip_path = upload_service.resolve_upload(file, upload_id)
+    if not zip_path: raise Exception("Sweep 必须上传数据集")
+    dataset_name = os.path.splitext(upload_service.upload_name(zip_path))[0]
+
+    record = {
+        "name": sweep_name,
+        "strategy": strategy,
+        "status": "running",
+        "eta": int(eta),
+        "early_stop": bool(early_stop),
+        "rungs": make_rungs(epochs, min_epochs, eta),
+        "space": space,
+        "base": {
+            "model_name": model_name, "epochs": epochs, "batch": batch, "imgsz": imgsz,
+            "extra_args": {k: v for k, v in (extra_args or {}).items() if v not in (None, '')}
+        },
+        "started": time.time(),
+        "finished": None,
+        "trials": [{
+            "id": i + 1,
+            "project": projects[i],
+            "params": params,
+            "status": "pending",
+            "epochs_done": 0,
+            "best_map50": 0.0,
+            "best_map50_95": 0.0,
+            "seconds": 0.0,
+            "score": 0.0,
+            "rung_maps": {}
+        } for i, params in enumerate(params_list)]
+    }
+    _save(record)
+
+    state.logs = [f"--- 开始超参数搜索: {sweep_name} ({strategy}, {len(params_list)} trials) ---\n"]
+    state.is_training = True
+
+    thread = threading.Thread(target=_run_sweep_thread, args=(record, zip_path, dataset_name))
+    thread.daemon = True
+    thread.start()
+    return record
+
+def get_sweep(sweep_name):
+    if not sweep_name or secure_filename(sweep_name) != sweep_name: return None
+    path = _sweep_path(sweep_name)
+    if not os.path.exists(path): return None
+    with open(path, 'r', encoding='utf-8') as f:
+        record = json.load(f)
+    record['leaderboard'] = get_leaderboard(record)
+    record['pruned'] = get_pruned(record)
+    return record
+
+def list_sweeps():
+    if not os.path.exists(Config.SWEEP_FOLDER): return []
+    sweeps = []
+    for f in sorted(os.listdir(Config.SWEEP_FOLDER)):
+        if not f.endswith('.json'): continue
+        record = get_sweep(f[:-5])
+        if record:
+            sweeps.append({
+                "name": record['name'], "strategy": record['strategy'], "status": record['status'],
+                "trials": len(record['trials']),
+                "best": record['leaderboard'][0]['project'] if record['leaderboard'] else None,
+                "pruned": len(record['pruned'])
+            })
+    return sweeps
@@ -1,5 +1,4 @@
-import psutil
-import pynvml
+from services import startup_service
 
 def get_system_status():
     status = {
@@ -13,6 +12,7 @@ def get_system_status():
 
     # 1. CPU & RAM
     try:
+        psutil = startup_service.lazy_import('psutil')
         status["cpu_percent"] = psutil.cpu_percent(interval=None)
         status["ram_percent"] = psutil.virtual_memory().percent
     except:
@@ -20,6 +20,7 @@ def get_system_status():
 
     # 2. GPU (NVIDIA)
     try:
+        pynvml = startup_service.lazy_import('pynvml')
         pynvml.nvmlInit()
         handle = pynvml.nvmlDeviceGetHandleByIndex(0) # 默认获取第0张卡
         
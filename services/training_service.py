@@ -7,8 +7,8 @@ import sys
 import json
 import yaml
 import time
-import pandas as pd
 from config import Config
+from services import metrics_service, dataset_service, upload_service, distributed_service, packed_service
 
 class TrainingState:
     def __init__(self):
@@ -113,12 +113,11 @@ def get_training_metrics(project_name):
     csv_path = os.path.join(Config.RUNS_FOLDER, project_name, 'results.csv')
     if not os.path.exists(csv_path): return None
     try:
-        df = pd.read_csv(csv_path)
-        df.columns = [c.strip() for c in df.columns] # 去空格
+        results = packed_service.load_results(csv_path) # 列名已去空格
         return {
-            "epoch": df['epoch'].tolist(),
-            "box_loss": df['train/box_loss'].tolist(),
-            "map50": df['metrics/mAP50(B)'].tolist()
+            "epoch": results['epoch'].tolist(),
+            "box_loss": results['train/box_loss'].tolist(),
+            "map50": results['metrics/mAP50(B)'].tolist()
         }
     except: return None
 
@@ -127,11 +126,10 @@ def get_latest_metrics(project_name):
     csv_path = os.path.join(Config.RUNS_FOLDER, project_name, 'results.csv')
     if not os.path.exists(csv_path): return None
     try:
-        df = pd.read_csv(csv_path)
-        df.columns = [c.strip() for c in df.columns]
-        if df.empty: return None
+        results = packed_service.load_results(csv_path)
+        if not len(results['epoch']): return None
         
-        last = df.iloc[-1]
+        last = {k: float(v[-1]) for k, v in results.items()}
         return {
             "epoch": int(last['epoch']),
             "box_loss": round(last['train/box_loss'], 5),
@@ -142,6 +140,133 @@ def get_latest_metrics(project_name):
 
 # ================= 训练线程逻辑 =================
 
+# 会透传给 yolo train 的参数 (新训练时生效，恢复训练会沿用之前的设置)
+AUG_PARAMS = ['degrees', 'translate', 'scale', 'shear', 'perspective', 'flipud', 'fliplr', 'mosaic', 'mixup']
+SYS_PARAMS = ['device', 'workers', 'patience', 'optimizer', 'cos_lr', 'lr0', 'lrf', 'momentum', 'weight_decay', 'cache']
+
+def find_yolo_exe():
+    """ 寻找 yolo 执行路径 """
+    yolo_exe = os.path.join(os.path.dirname(sys.executable), 'yolo')
+    if not os.path.exists(yolo_exe): yolo_exe = 'yolo'
+    if os.name == 'nt':
+        win_exe = os.path.join(os.path.dirname(sys.executable), 'Scripts', 'yolo.exe')
+        if os.path.exists(win_exe): yolo_exe = win_exe
+    return yolo_exe
+
+def prepare_dataset(zip_path, dataset_name):
+    """ 解压数据集并转换格式，返回 data.yaml 路径 """
+    extract_path = os.path.join(Config.DATASET_FOLDER, dataset_name)
+    state.logs.append(f"📦 [1/3] 解压数据集: {dataset_name}...\n")
+    
+    if os.path.exists(extract_path): shutil.rmtree(extract_path)
+    os.makedirs(extract_path)
+    
+    with metrics_service.track('dataset_extract'):
+        with zipfile.ZipFile(zip_path, 'r') as z: z.extractall(extract_path)
+    if state.stop_event: raise Exception("任务被终止")
+
+    state.logs.append(f"🔄 [2/3] 检查格式...\n")
+    try:
+        with metrics_service.track('dataset_convert'):
+            yaml_path = COCOConverter.convert(extract_path)
+    except Exception as e:
+        # 兜底寻找
+        yaml_path = None
+        for r, _, f in os.walk(extract_path):
+            if 'data.yaml' in f:
+                yaml_path = os.path.join(r, 'data.yaml')
+                break
+        if not yaml_path: raise Exception("找不到 data.yaml 且无法自动转换")
+    
+    state.logs.append(f"✅ 数据集准备就绪: {yaml_path}\n")
+    return yaml_path
+
+def prepare_dataset_cache(yaml_path, imgsz, extra_args):
+    """
+    训练前并行校验数据集并建立解码缓存，缓存就绪时让训练命令使用 cache=disk
+    返回 (训练使用的 data.yaml, extra_args)；标注需要清理时 data.yaml 换成训练缓存中的镜像
+    """
+    if not Config.DATASET_CACHE or extra_args.get('cache'): return yaml_path, extra_args
+    try:
+        stats = dataset_service.prepare(yaml_path, imgsz or 640, log=state.logs.append)
+    except Exception as e:
+        state.logs.append(f"⚠️ 数据集预处理失败，跳过缓存: {e}\n")
+        return yaml_path, extra_args
+    if state.stop_event: raise Exception("任务被终止")
+    if stats['cache_ready']: return stats['yaml_path'], {**extra_args, 'cache': 'disk'}
+    return stats['yaml_path'], extra_args
+
+def build_train_cmd(yaml_path, model_name, epochs, batch, imgsz, project_name, extra_args):
+    """ 构造新训练的 yolo train 命令 """
+    cmd = [find_yolo_exe(), "train"]
+    cmd.append(f"model={model_name}")
+    cmd.append(f"data={yaml_path}")
+    cmd.append(f"epochs={epochs}")
+    cmd.append(f"batch={batch}")
+    cmd.append(f"imgsz={imgsz}")
+    cmd.append(f"project={Config.RUNS_FOLDER}")
+    cmd.append(f"name={project_name}")
+    cmd.append("exist_ok=True")
+    
+    # === 添加增强参数 (Augmentation) 和系统参数 ===
+    for arg in AUG_PARAMS + SYS_PARAMS:
+        if extra_args.get(arg) not in (None, ''):
+            cmd.append(f"{arg}={extra_args.get(arg)}")
+    return cmd
+
+def run_yolo_process(cmd, monitor=None, monitor_interval=5.0):
+    """
+    启动 yolo 子进程并把输出写入日志
+    monitor: 可选回调，每隔 monitor_interval 秒调用一次，返回非空字符串表示提前终止 (原因写入日志)
+    返回 'ok' / 'error' / 'stopped' / 'pruned'
+    """
+    state.logs.append(f"🔧 命令: {' '.join(cmd)}\n")
+    
+    train_start = time.perf_counter()
+    process = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, 
+        text=True, bufsize=1, encoding='utf-8', errors='replace'
+    )
+    state.process = process
+    metrics_service.gauge_add('yolo_training_in_progress', 1)
+
+    status = None
+    last_check = time.time()
+    try:
+        for line in iter(process.stdout.readline, ''):
+            if state.stop_event:
+                process.terminate()
+                state.logs.append("\n🛑 用户点击终止，正在停止...\n")
+                status = 'stopped'
+                break
+            if line: state.logs.append(line)
+            if monitor and time.time() - last_check > monitor_interval:
+                last_check = time.time()
+                reason = monitor()
+                if reason:
+                    process.terminate()
+                    state.logs.append(f"\n✂️ 提前终止: {reason}\n")
+                    status = 'pruned'
+                    break
+        
+        if status is None and state.stop_event:
+            status = 'stopped'  # stop_training() 已经 terminate 了进程
+        if status is None:
+            if process.wait() == 0:
+                state.logs.append("\n✅ 训练完成！\n")
+                status = 'ok'
+            else:
+                state.logs.append("\n❌ 训练异常退出\n")
+                status = 'error'
+        else:
+            process.wait()
+    finally:
+        metrics_service.gauge_add('yolo_training_in_progress', -1)
+        metrics_service.observe('yolo_stage_duration_seconds', time.perf_counter() - train_start, stage='train_run')
+        metrics_service.inc('yolo_stage_total', stage='train_run', status=status or 'error')
+        state.process = None
+    return status
+
 def _run_full_process_thread(zip_path, dataset_name, model_name, epochs, batch, imgsz, project_name, extra_args):
     global state
     state.stop_event = False
@@ -150,8 +275,6 @@ def _run_full_process_thread(zip_path, dataset_name, model_name, epochs, batch,
         # === 1. 判断是否为恢复训练 (Resume) ===
         is_resume = extra_args.get('resume') == 'True'
         resume_path = os.path.join(Config.RUNS_FOLDER, project_name, 'weights', 'last.pt')
-        
-        yaml_path = None # 初始化
 
         if is_resume:
             if not os.path.exists(resume_path):
@@ -159,98 +282,23 @@ def _run_full_process_thread(zip_path, dataset_name, model_name, epochs, batch,
                 state.is_training = False
                 return
             state.logs.append(f"🔄 [1/3] 检测到恢复训练请求，加载: {resume_path}...\n")
-            # 恢复训练时，不需要解压数据集（假设已经存在），直接复用
-            # 但为了保险，我们还是定义一下 yaml 路径，防止 yolo 找不到
-            # 这里简单处理：假设用户之前的路径没变。
-            # 实际上 resume=True 时，YOLO 会从 last.pt 里读取所有配置，我们可以跳过解压步骤
+            # 恢复训练时，YOLO 会从 last.pt 里读取所有配置，可以跳过解压步骤
+            cmd = [find_yolo_exe(), "train", f"model={resume_path}", "resume=True"]
         else:
             # === 非恢复训练：正常解压和转换 ===
-            extract_path = os.path.join(Config.DATASET_FOLDER, dataset_name)
-            state.logs.append(f"📦 [1/3] 解压数据集: {dataset_name}...\n")
-            
-            if os.path.exists(extract_path): shutil.rmtree(extract_path)
-            os.makedirs(extract_path)
-            
-            with zipfile.ZipFile(zip_path, 'r') as z: z.extractall(extract_path)
-            if state.stop_event: raise Exception("任务被终止")
+            yaml_path = prepare_dataset(zip_path, dataset_name)
+            yaml_path, extra_args = prepare_dataset_cache(yaml_path, imgsz, extra_args)
+            cmd = build_train_cmd(yaml_path, model_name, epochs, batch, imgsz, project_name, extra_args)
 
-            state.logs.append(f"🔄 [2/3] 检查格式...\n")
-            try:
-                # 假设你保留了 COCOConverter
-                from services.training_service import COCOConverter
-                yaml_path = COCOConverter.convert(extract_path)
-            except Exception as e:
-                # 兜底寻找
-                found = False
-                for r, _, f in os.walk(extract_path):
-                    if 'data.yaml' in f:
-                        yaml_path = os.path.join(r, 'data.yaml')
-                        found = True
-                        break
-                if not found: raise Exception("找不到 data.yaml 且无法自动转换")
-            
-            state.logs.append(f"✅ 数据集准备就绪: {yaml_path}\n")
+        # === 2. 多进程 / 多节点 CPU 数据并行 ===
+        if distributed_service.is_enabled(extra_args):
+            cmd = distributed_service.build_train_cmd(cmd, project_name, extra_args, resume=is_resume, log=state.logs.append)
 
         if state.stop_event: raise Exception("任务被终止")
 
-        # === 3. 构造训练命令 ===
+        # === 3. 启动训练 ===
         state.logs.append(f"🚀 [3/3] 启动训练...\n")
-        
-        # 寻找 yolo 执行路径
-        yolo_exe = os.path.join(os.path.dirname(sys.executable), 'yolo')
-        if not os.path.exists(yolo_exe): yolo_exe = 'yolo'
-        if os.name == 'nt':
-            win_exe = os.path.join(os.path.dirname(sys.executable), 'Scripts', 'yolo.exe')
-            if os.path.exists(win_exe): yolo_exe = win_exe
-
-        cmd = [yolo_exe, "train"]
-
-        if is_resume:
-            # 恢复训练核心参数
-            cmd.append(f"model={resume_path}")
-            cmd.append("resume=True")
-        else:
-            # 新训练核心参数
-            cmd.append(f"model={model_name}")
-            cmd.append(f"data={yaml_path}")
-            cmd.append(f"epochs={epochs}")
-            cmd.append(f"batch={batch}")
-            cmd.append(f"imgsz={imgsz}")
-            cmd.append(f"project={Config.RUNS_FOLDER}")
-            cmd.append(f"name={project_name}")
-            cmd.append("exist_ok=True")
-            
-            # === 添加增强参数 (Augmentation) ===
-            # 只有在新训练时生效，恢复训练会沿用之前的设置
-            aug_params = ['degrees', 'translate', 'scale', 'shear', 'perspective', 'flipud', 'fliplr', 'mosaic', 'mixup']
-            for arg in aug_params:
-                if extra_args.get(arg):
-                    cmd.append(f"{arg}={extra_args.get(arg)}")
-
-            # 添加系统参数
-            sys_params = ['device', 'workers', 'patience', 'optimizer', 'cos_lr']
-            for arg in sys_params:
-                if extra_args.get(arg):
-                    cmd.append(f"{arg}={extra_args.get(arg)}")
-
-        state.logs.append(f"🔧 命令: {' '.join(cmd)}\n")
-        
-        process = subprocess.Popen(
-            cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, 
-            text=True, bufsize=1, encoding='utf-8', errors='replace'
-        )
-        state.process = process
-
-        for line in iter(process.stdout.readline, ''):
-            if state.stop_event:
-                process.terminate()
-                state.logs.append("\n🛑 用户点击终止，正在停止...\n")
-                break
-            if line: state.logs.append(line)
-        
-        if not state.stop_event:
-            if process.wait() == 0: state.logs.append("\n✅ 训练完成！\n")
-            else: state.logs.append("\n❌ 训练异常退出\n")
+        run_yolo_process(cmd)
 
     except Exception as e:
         state.logs.append(f"\n❌ 错误: {str(e)}\n")
@@ -258,7 +306,7 @@ def _run_full_process_thread(zip_path, dataset_name, model_name, epochs, batch,
         state.is_training = False
         state.process = None
 
-def start_training_task(file, model_name, epochs, batch, imgsz, project_name, extra_args):
+def start_training_task(file, model_name, epochs, batch, imgsz, project_name, extra_args, upload_id=None):
     if state.is_training: raise Exception("已有任务在运行")
     
     # 如果是 Resume，不需要上传文件
@@ -268,11 +316,10 @@ def start_training_task(file, model_name, epochs, batch, imgsz, project_name, ex
     dataset_name = ""
 
     if not is_resume:
-        if not file: raise Exception("新训练必须上传数据集")
-        filename = file.filename
-        zip_path = os.path.join(Config.UPLOAD_FOLDER, filename)
-        file.save(zip_path)
-        dataset_name = os.path.splitext(filename)[0]
+        # 大数据集走分块上传，完成后只传 upload_id
+        zip_path = upload_service.resolve_upload(file, upload_id)
+        if not zip_path: raise Exception("新训练必须上传数据集")
+        dataset_name = os.path.splitext(upload_service.upload_name(zip_path))[0]
     
     state.logs = [f"--- 开始任务: {project_name} {'(恢复训练)' if is_resume else ''} ---\n"]
     state.is_training = True
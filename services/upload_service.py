@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from werkzeug.utils import secure_filename
+from config import Config
+
+# ================= 分块断点续传 =================
+# 1. init:     POST 文件名/大小/块大小 -> upload_id，服务端预分配 <id>.part
+# 2. chunk:    PUT 第 i 块 (可乱序、可并发)，先流式写入该块自己的临时文件并计算 sha256，
+#              长度和 X-Chunk-SHA256 都通过后才拷贝到 offset = i * chunk_size；校验失败的数据不会进入 .part
+# 3. status:   GET 返回已接收/缺失的块，网络中断后按 upload_id 续传
+# 4. complete: 所有块到齐 (可选整体 sha256 校验) 后移动到 uploads/<upload_id>_<文件名> (同名上传互不覆盖)，
+#              训练和推理可以直接用 upload_id 启动
+# 未完成的上传放在 uploads_partial/ (不在 static 下，不会被直接访问)
+
+STREAM_BLOCK = 1024 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+def _lock(upload_id):
+    with _locks_guard:
+        return _locks.setdefault(upload_id, threading.Lock())
+
+def _meta_path(upload_id):
+    return os.path.join(Config.CHUNK_FOLDER, f"{upload_id}.json")
+
+def _part_path(upload_id):
+    return os.path.join(Config.CHUNK_FOLDER, f"{upload_id}.part")
+
+def _check_id(upload_id):
+    # upload_id 会拼进路径，只允许 init 生成的十六进制 id
+    if not upload_id or not all(c in '0123456789abcdef' for c in upload_id):
+        raise Exception("非法的 upload_id")
+
+def _load(upload_id):
+    _check_id(upload_id)
+    path = _meta_path(upload_id)
+    if not os.path.exists(path): raise Exception(f"上传不存在或已过期: {upload_id}")
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _save(meta):
+    path = _meta_path(meta['id'])
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(path + '.tmp', path)
+
+def _status(meta):
+    received = set(meta['received'])
+    return {
+        "upload_id": meta['id'],
+        "filename": meta['filename'],
+        "size": meta['size'],
+        "chunk_size": meta['chunk_size'],
+        "total_chunks": meta['total_chunks'],
+        "received": sorted(received),
+        "missing": [i for i in range(meta['total_chunks']) if i not in received],
+        "status": meta['status'],
+        "path": meta.get('path')
+    }
+
+def init_upload(filename, size, chunk_size=8 * 1024 * 1024, sha256=None):
+    filename = secure_filename(filename or '')
+    size, chunk_size = int(size), int(chunk_size)
+    if not filename or not Config.allowed_file(filename): raise Exception("不支持的文件类型")
+    if size <= 0: raise Exception("文件大小无效")
+    if not 0 < chunk_size <= MAX_CHUNK_SIZE: raise Exception(f"块大小必须在 1B ~ {MAX_CHUNK_SIZE}B 之间")
+
+    cleanup_expired()
+    os.makedirs(Config.CHUNK_FOLDER, exist_ok=True)
+    meta = {
+        "id": uuid.uuid4().hex,
+        "filename": filename,
+        "size": size,
+        "chunk_size": chunk_size,
+        "total_chunks": (size + chunk_size - 1) // chunk_size,
+        "sha256": sha256,
+        "received": [],
+        "status": "uploading",
+        "created": time.time(),
+        "updated": time.time()
+    }
+    # 预分配目标文件，之后各块直接写入对应位置
+    with open(_part_path(meta['id']), 'wb') as f:
+        f.truncate(size)
+    _save(meta)
+    return _status(meta)
+
+def write_chunk(upload_id, index, stream, checksum=None):
+    """ 请求体先流式写入该块的临时文件 (不把整块读进内存)，校验通过后再拷贝到 .part 的对应位置 """
+    meta = _load(upload_id)
+    index = int(index)
+    if meta['status'] != 'uploading': raise Exception("上传已完成")
+    if not 0 <= index < meta['total_chunks']: raise Exception(f"块序号越界: {index}")
+
+    offset = index * meta['chunk_size']
+    expected = min(meta['chunk_size'], meta['size'] - offset)
+    tmp = os.path.join(Config.CHUNK_FOLDER, f"{upload_id}.{index}.{uuid.uuid4().hex[:8]}.chunk")
+    try:
+        h = hashlib.sha256()
+        written = 0
+        with open(tmp, 'wb') as f:
+            while written < expected:
+                block = stream.read(min(STREAM_BLOCK, expected - written))
+                if not block: break
+                f.write(block)
+                h.update(block)
+                written += len(block)
+
+        if written != expected: raise Exception(f"块 {index} 长度不完整: {written}/{expected}")
+        if checksum and checksum.lower() != h.hexdigest(): raise Exception(f"块 {index} 校验失败")
+
+        # 同一块可能被并发重传，拷贝和登记都在锁内完成
+        with _lock(upload_id):
+            meta = _load(upload_id)
+            if meta['status'] != 'uploading': raise Exception("上传已完成")
+            with open(tmp, 'rb') as src, open(_part_path(upload_id), 'r+b') as dst:
+                dst.seek(offset)
+                shutil.copyfileobj(src, dst, STREAM_BLOCK)
+            if index not in meta['received']: meta['received'].append(index)
+            meta['updated'] = time.time()
+            _save(meta)
+    finally:
+        if os.path.exists(tmp): os.remove(tmp)
+    return _status(meta)
+
+def get_status(upload_id):
+    return _status(_load(upload_id))
+
+def complete_upload(upload_id, sha256=None):
+    """ sha256: 整个文件的校验值，也可以在 init 时提供 (前端边上传边计算，完成时才知道) """
+    with _lock(upload_id):
+        meta = _load(upload_id)
+        if meta['status'] == 'completed': return _status(meta)
+        status = _status(meta)
+        if status['missing']: raise Exception(f"还有 {len(status['missing'])} 个块未上传")
+
+        part = _part_path(upload_id)
+        expected = sha256 or meta.get('sha256')
+        if expected:
+            h = hashlib.sha256()
+            with open(part, 'rb') as f:
+                for block in iter(lambda: f.read(STREAM_BLOCK), b''):
+                    h.update(block)
+            if h.hexdigest() != expected.lower():
+                # 不知道是哪一块出错，清空已接收记录，客户端重新提交时会重传所有块
+                meta.update(received=[], updated=time.time())
+                _save(meta)
+                raise Exception("文件整体校验失败，请重新上传")
+
+        dest = os.path.join(Config.UPLOAD_FOLDER, f"{upload_id}_{meta['filename']}")
+        shutil.move(part, dest)
+        meta.update(status='completed', path=dest, updated=time.time())
+        _save(meta)
+        return _status(meta)
+
+def get_completed_path(upload_id):
+    """ 训练 / 推理通过 upload_id 取到已完成的文件路径 """
+    meta = _load(upload_id)
+    if meta['status'] != 'completed' or not os.path.exists(meta.get('path') or ''):
+        raise Exception("上传尚未完成")
+    return meta['path']
+
+def cleanup_expired():
+    """ 清理超过 CHUNK_EXPIRE_HOURS 没有更新的未完成上传 """
+    if not os.path.exists(Config.CHUNK_FOLDER): return 0
+    expire = time.time() - Config.CHUNK_EXPIRE_HOURS * 3600
+    removed = 0
+    for f in os.listdir(Config.CHUNK_FOLDER):
+        path = os.path.join(Config.CHUNK_FOLDER, f)
+        if f.endswith('.chunk') and os.path.getmtime(path) < expire:
+            os.remove(path)  # 进程中途退出留下的块临时文件
+            continue
+        if not f.endswith('.json'): continue
+        upload_id = f[:-5]
+        try:
+            meta = _load(upload_id)
+            if meta['updated'] > expire: continue
+            for p in [_part_path(upload_id), _meta_path(upload_id)]:
+                if os.path.exists(p): os.remove(p)
+            removed += 1
+        except Exception:
+            pass
+    return removed
+
+TEMP_PREFIX = '.tmp_'
+
+def upload_name(path):
+    """ 上传文件的原始文件名: 去掉临时文件的 .tmp_<随机>_ 前缀或分块上传的 <upload_id>_ 前缀 """
+    name = os.path.basename(path)
+    if name.startswith(TEMP_PREFIX): return name.split('_', 2)[2]
+    prefix, _, rest = name.partition('_')
+    if rest and len(prefix) == 32 and all(c in '0123456789abcdef' for c in prefix): return rest
+    return name
+
+def publish(path):
+    """ 临时文件处理完后原子地改名为 uploads/<文件名>，正在读取旧文件的请求不受影响 """
+    if not os.path.basename(path).startswith(TEMP_PREFIX): return path
+    dest = os.path.join(Config.UPLOAD_FOLDER, upload_name(path))
+    os.replace(path, dest)
+    return dest
+
+def resolve_upload(file=None, upload_id=None, keep_temp=False):
+    """
+    训练 / Sweep / 推理的统一入口: 优先使用已完成的分块上传，否则保存普通表单文件，都没有返回 None
+    表单文件先保存为唯一的临时文件，同名文件的并发上传不会互相覆盖；
+    keep_temp=True 时返回临时文件 (推理先对它计算 hash 和推理，之后再 publish)，否则立即改名为 uploads/<文件名>
+    """
+    if upload_id: return get_completed_path(upload_id)
+    if file and file.filename:
+        path = os.path.join(Config.UPLOAD_FOLDER, f"{TEMP_PREFIX}{uuid.uuid4().hex[:12]}_{secure_filename(file.filename)}")
+        file.save(path)
+        return path if keep_temp else publish(path)
+    return None